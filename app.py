@@ -1,11 +1,40 @@
 # login.py
-import streamlit as st
-import app_principal  # importa o arquivo da app principal
 import hashlib
+import logging
+import threading
+
+import streamlit as st
+
+# A tela de login só precisa do Streamlit: o app_principal (pandas, altair,
+# pyarrow) é importado na thread de aquecimento e depois do login
 st.set_page_config(
     page_title="Dashboard - Peças de Pessoas em Situação de Rua",
     layout="wide"
 )
+
+
+@st.cache_resource(show_spinner=False)
+def aquecimento() -> threading.Thread:
+    # Uma vez por processo, na primeira execução (a da tela de login):
+    # importa o app e carrega os dados em segundo plano, para o primeiro
+    # usuário autenticado já encontrar o cache do load_data pronto. Se ele
+    # entrar antes do fim, o load_data espera a carga em andamento.
+    def aquecer():
+        try:
+            import app_principal
+            app_principal.aquecer()
+        except Exception:
+            # O mesmo erro aparece (na tela) no primeiro acesso; aqui só fica
+            # registrado no log do servidor
+            logging.getLogger(__name__).exception("Falha no aquecimento dos dados")
+
+    thread = threading.Thread(target=aquecer, name="bnmp-aquecimento", daemon=True)
+    thread.start()
+    return thread
+
+
+aquecimento()
+
 # DICIONÁRIO DE USUÁRIOS (exemplo simples)
 # ⚠ Em produção, o ideal é NÃO deixar isso hardcoded no código.
 USERS = {
@@ -55,6 +84,7 @@ def main():
         st.stop()
     else:
         st.sidebar.success(f"Logado como {st.session_state.username}")
+        import app_principal  # importa o arquivo da app principal
         app_principal.main()
 
 if __name__ == "__main__":
@@ -1,168 +1,77 @@
+import functools
+import os
+import uuid
+
 import streamlit as st
 import pandas as pd
-import altair as alt
-
-st.set_page_config(
-    page_title="Dashboard - Peças de Pessoas em Situação de Rua",
-    layout="wide"
-)
- # ==========================
-    # Tabela de motivos do alvará (TABELA1)
-    # ==========================
-MOTIVO_MAP = {
-        1: "Revogação de preventiva",
-        2: "Liberdade provisória com medidas cautelares",
-        3: "Liberdade provisória",
-        4: "Progressão de regime",
-        5: "Concessão de regime semiaberto harmonizado",
-        7: "Relaxamento de prisão",
-        8: "Revogação da prisão temporária",
-        9: "Extinção de punibilidade",
-        10: "Extinção da pena",
-        11: "Arquivamento do inquérito",
-        12: "Absolvição",
-        13: "Trancamento da ação penal",
-        14: "Quitação de débito alimentar",
-        15: "Revogação de deportação/extradição/expulsão",
-        16: "Livramento condicional",
-        17: "Arquivamento de ação penal",
-        18: "Outras medidas cautelares",
-        19: "Relaxamento de Prisão de Pessoa Presa em Lugar de Outra",
-        20: "Regime Aberto Monitoramento Eletrônico",
-        21: "Prisão domiciliar",
-        22: "Liberdade Provisória com fiança",
-        23: "Liberdade Provisória sem fiança",
-        24: "Habeas Corpus",
-        25: "Recolhimento da fiança arbitrada pela autoridade policial",
-        26: "Término da Prisão Temporária",
-        27: "Rejeição da denúncia ou queixa",
-        28: "Impronúncia",
-        29: "Condenação em regime aberto",
-        30: "Indulto humanitário",
-        31: "Regime Especial de semiliberdade aplicada à pessoa indígena",
-        99: "Revogação Decorrente de Erro Material no Mandado",
-    }
-STATUS_MAP = {
-    2:"Procurado", 
-3:"Foragido", 
-4:"Morto", 
-5:"Em Liberdade", 
-7:"Preso Condenado em Execução Provisória", 
-8:"Preso Condenado em Execução Definitiva", 
-9:"Preso Provisório (inválido - não utilizar)", 
-10:"Internado Provisório", 
-11:"Internado em Execução Provisória", 
-12:"Internado em Execução Definitiva", 
-13:"Preso Civil", 
-14:"Em Monitoramento", 
-15:"Em Saída Temporária", 
-16:"Preso em Saída Temporária Autorizada para Estudo ou Trabalho", 
-17:"Evadido", 
-18:"Preso em Flagrante", 
-19:"Em Tratamento Ambulatorial", 
-20:"Em acompanhamento de medidas diversas da prisão", 
-21:"Em acompanhamento de medidas diversas da prisão em execução", 
-22:"Preso definitivo", 
-23:"Internado definitivo", 
-24:"Preso preventivo", 
-25:"Preso temporário", 
-26:"Aguardando soltura", 
-27:"Preso para deportação/extradição/expulsão", 
-28:"Deportado/extraditado/expulso", 
-29:"Procurado para condução coercitiva"
-}
-# ==========================
-# Carregamento de dados
-# ==========================
-@st.cache_data
-def load_data(path: str) -> pd.DataFrame:
-    df = pd.read_csv(path,sep=";")
-
-    # Garante que os códigos sejam numéricos (quando possível)
-    for col in ["SEQ_MUNICIPIO3", "SEQ_MOTIVO_EXPEDICAO_ALVARA"]:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce").astype("Int64")
-
-    return df
-
- # Funções auxiliares para formatar as opções do filtro
-def format_municipio_opt(x, municipio_dict):
-    if isinstance(x, str) and x == "SEM_MUNICIPIO":
-        return "SEM MUNICÍPIO INFORMADO"
-    x=int(x)
-    nome = municipio_dict.get(x, "")
-    return f"{x} - {nome}"
-
-def format_motivo_opt(x):
-    if isinstance(x, str) and x == "SEM_MOTIVO":
-        return "SEM MOTIVO INFORMADO"
-    # x aqui é código numérico
-    cod = int(x)
-    desc = MOTIVO_MAP.get(cod, "Não informado / Outro")
-    return f"{cod} - {desc}"
-
-def format_status_opt(x):
-    if isinstance(x, str) and x == "SEM_STATUS":
-        return "SEM STATUS INFORMADO"
-    # x aqui é código numérico
-    cod = int(x)
-    desc = STATUS_MAP.get(cod, "Não informado / Outro")
-    return f"{cod} - {desc}"
-
-def gerarFiltroMunicipio(df):
-    # Dicionário código -> nome (apenas onde temos código e nome)
-    muni_df_dict = (
-            df[["SEQ_MUNICIPIO3", "NOM_MUNICIPIO"]]
-            .dropna(subset=["SEQ_MUNICIPIO3", "NOM_MUNICIPIO"])
-            .drop_duplicates()
-        )
-    municipio_dict = {
-            row["SEQ_MUNICIPIO3"]: row["NOM_MUNICIPIO"]
-            for _, row in muni_df_dict.iterrows()
-        }
-       # Códigos de município distintos (incluindo os que não têm nome)
-    muni_codes = (
-            df["SEQ_MUNICIPIO3"]
-            .drop_duplicates()
-            .dropna()
-            .sort_values()
-            .tolist()
-        )
-        
-    has_null_muni = df["SEQ_MUNICIPIO3"].isna().any()
 
-    municipio_options = muni_codes.copy()
-    if has_null_muni:
-        municipio_options.append("SEM_MUNICIPIO")
+import dados
+import exportar
+import graficos
+import medicao
+import nucleo
+import qualidade
+import servico
+from conjunto import ConjuntoBNMP
+from tabelas import MOTIVO_MAP, STATUS_MAP
 
-    return municipio_dict,municipio_options
+# CSV único ou diretório de partições (ex.: UF=SP/ANO=2024/extrato.csv)
+DATA_PATH = os.environ.get("BNMP_DADOS", "BNMP_MORADOR_RUA.CSV")
 
+# Endereço do serviço de agregação (ver servico.py); vazio = dados locais
+SERVICO = os.environ.get("BNMP_SERVICO", "")
+
+
+# ==========================
+# Carregamento de dados
+# ==========================
+@st.cache_resource(max_entries=1, show_spinner="Carregando dados...")
+def load_data(path: str, estado: tuple = None) -> ConjuntoBNMP:
+    # Um único conjunto por processo, compartilhado (somente leitura) entre
+    # todas as sessões: tabela memory-mapped do cache colunar ao lado do
+    # CSV, índice dos filtros e cubo de contagens (ver conjunto.py).
+    # `estado` (tamanho e data do CSV) só serve de chave do cache, para
+    # recarregar quando o arquivo mudar. Extratos grandes, com o DuckDB
+    # instalado (ou BNMP_BACKEND=duckdb/sqlite), são servidos por um banco
+    # embutido, com a mesma interface (ver conjunto_sql.py). Com
+    # BNMP_SERVICO, várias réplicas consultam um único processo dono dos
+    # dados (ver servico.py).
+    if SERVICO:
+        return servico.ConjuntoRemoto.conectar(SERVICO)
+    return nucleo.carregar(path)
+
+
+def estado_atual(path: str = DATA_PATH) -> tuple:
+    # Chave do load_data; com o serviço, o CSV nem precisa existir aqui e a
+    # troca de versão é detectada a cada consulta (ver com_dados_atuais)
+    if SERVICO:
+        return (SERVICO,)
+    return dados.estado_dados(path)
+
+
+def aquecer(path: str = DATA_PATH) -> None:
+    # Chamado em segundo plano pelo app.py enquanto a tela de login é
+    # exibida: carrega o conjunto no mesmo cache do load_data e já calcula
+    # o resultado sem filtros (a seleção padrão), que é o primeiro pedido
+    conjunto = load_data(path, estado_atual(path))
+    resultado = nucleo.filtrar(conjunto, {})
+    _ = resultado.posicoes
+    _ = resultado.resumo
+
+# Filtros linha a linha sobre um DataFrame. O dashboard aplica a mesma regra
+# pelo índice pré-calculado (indice.IndiceFiltros.selecionar)
 def filtrarMunicipio(selected_municipios,filtered_df):
     mask_muni = pd.Series(False, index=filtered_df.index)
     # valores numéricos (códigos)
     muni_numeric = [m for m in selected_municipios if not isinstance(m, str)]
     if muni_numeric:
         mask_muni |= filtered_df["SEQ_MUNICIPIO3"].isin(muni_numeric)
-        # opção "SEM_MUNICIPIO" -> inclui registros sem código
-        if "SEM_MUNICIPIO" in selected_municipios:
-            mask_muni |= filtered_df["SEQ_MUNICIPIO3"].isna()
-        filtered_df = filtered_df[mask_muni]
+    # opção "SEM_MUNICIPIO" -> inclui registros sem código
+    if "SEM_MUNICIPIO" in selected_municipios:
+        mask_muni |= filtered_df["SEQ_MUNICIPIO3"].isna()
+    filtered_df = filtered_df[mask_muni]
     return filtered_df
 
-def gerarFiltroMotivo(df):
-    motivos_presentes = (
-            df["SEQ_MOTIVO_EXPEDICAO_ALVARA"]
-            .drop_duplicates()
-            .dropna()
-            .sort_values()
-            .tolist()
-        )
-    motivo_options = motivos_presentes.copy()
-    has_null_motivo = df["SEQ_MOTIVO_EXPEDICAO_ALVARA"].isna().any()
-    if has_null_motivo:
-        motivo_options.append("SEM_MOTIVO")
-    return motivos_presentes,motivo_options
-
 def filtrarMotivo(selected_motivos,filtered_df):
     mask_motivo = pd.Series(False, index=filtered_df.index)
     motivo_numeric = [m for m in selected_motivos if not isinstance(m, str)]
@@ -174,20 +83,6 @@ def filtrarMotivo(selected_motivos,filtered_df):
     filtered_df = filtered_df[mask_motivo]
     return filtered_df
 
-def gerarFiltroStatus(df):
-    status_presentes = (
-            df["SEQ_STATUS"]
-            .drop_duplicates()
-            .dropna()
-            .sort_values()
-            .tolist()
-        )
-    status_options = status_presentes.copy()
-    has_null_motivo = df["SEQ_STATUS"].isna().any()
-    if has_null_motivo:
-        status_options.append("SEM_STATUS")
-    return status_presentes,status_options
-
 def filtrarStatus(selected_status,filtered_df):
     mask_status = pd.Series(False, index=filtered_df.index)
     status_numeric = [m for m in selected_status if not isinstance(m, str)]
@@ -203,368 +98,453 @@ def filtrarStatus(selected_status,filtered_df):
 
 
 
-def main():
-    DATA_PATH = "BNMP_MORADOR_RUA.CSV"  # ajuste o caminho se necessário
-    df = load_data(DATA_PATH)
+# ==========================
+# Medição das execuções (ver medicao.py)
+# ==========================
+# Usuários que veem os painéis de desempenho e de qualidade dos dados na
+# barra lateral ("*" = todos)
+ADMINS = set(filter(None, os.environ.get("BNMP_ADMINS", "").split(",")))
+
+
+def eh_admin() -> bool:
+    return "*" in ADMINS or st.session_state.get("username") in ADMINS
+
+
+def com_medicao(tipo):
+    # Abre uma medição para a execução: a do script inteiro ("app") ou a de
+    # um fragmento reexecutado sozinho. Dentro de uma execução completa o
+    # fragmento só acrescenta as suas etapas à medição já aberta.
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def executar(*args, **kwargs):
+            atual = st.session_state.get("_medicao")
+            if atual is not None and not atual.finalizada:
+                return funcao(*args, **kwargs)
+            sessao = st.session_state.setdefault("_sessao", uuid.uuid4().hex[:12])
+            atual = medicao.Medicao(sessao, tipo)
+            st.session_state["_medicao"] = atual
+            try:
+                return funcao(*args, **kwargs)
+            finally:
+                atual.finalizar()
+                st.session_state["_medicao_anterior"] = atual
+
+        return executar
+
+    return decorador
+
+
+def com_dados_atuais(funcao):
+    # Com o serviço de agregação: se ele passou a servir outro extrato,
+    # descarta o conjunto da réplica (opções e resultados da versão antiga)
+    # e refaz a execução inteira sobre o novo
+    @functools.wraps(funcao)
+    def executar(*args, **kwargs):
+        try:
+            return funcao(*args, **kwargs)
+        except servico.VersaoDesatualizada:
+            load_data.clear()
+            st.rerun(scope="app")
+
+    return executar
+
+
+def etapa(nome, linhas_entrada=None):
+    return st.session_state["_medicao"].etapa(nome, linhas_entrada)
+
+
+def painel_desempenho():
+    # Etapas da execução anterior (a atual ainda não terminou) e, sob
+    # demanda, p50/p95 de todas as execuções do log
+    if not eh_admin():
+        return
+    with st.sidebar.expander("Desempenho"):
+        anterior = st.session_state.get("_medicao_anterior")
+        if anterior is None:
+            st.caption("Nenhuma execução medida ainda.")
+        else:
+            st.caption(f"Execução anterior ({anterior.tipo}): {anterior.segundos:.3f}s")
+            st.dataframe(anterior.tabela(), use_container_width=True, hide_index=True)
+        if st.button("p50/p95 por etapa"):
+            st.dataframe(medicao.percentis(), use_container_width=True, hide_index=True)
+
+
+def botao_exportacao(rotulo, nome_arquivo, gerar_lotes, key):
+    # O arquivo só é gerado quando o usuário clica (download adiado do
+    # Streamlit), em lotes e direto para um temporário em disco; ver
+    # exportar.py. `gerar_lotes` devolve os DataFrames a exportar.
+    c1, c2 = st.columns([1, 3], vertical_alignment="bottom")
+    formato = c1.selectbox(
+        "Formato", list(exportar.FORMATOS), format_func=str.upper, key=f"{key}_formato"
+    )
+    mime, extensao = exportar.FORMATOS[formato]
+    c2.download_button(
+        rotulo,
+        data=lambda: exportar.arquivo_temporario(gerar_lotes(), formato),
+        file_name=nome_arquivo + extensao,
+        mime=mime,
+        on_click="ignore",
+        key=key,
+    )
 
-   
 
-    if "SEQ_MOTIVO_EXPEDICAO_ALVARA" in df.columns:
-        df["DSC_MOTIVO_EXPEDICAO_ALVARA"] = (
-            df["SEQ_MOTIVO_EXPEDICAO_ALVARA"]
-            .map(MOTIVO_MAP)
-            .fillna("Não informado / Outro")
+@st.cache_data(show_spinner=False)
+def relatorio_qualidade(path: str, estado: tuple) -> pd.DataFrame:
+    # Lido dos manifestos do cache (calculado na ingestão, ver qualidade.py);
+    # `estado` só serve de chave, como no load_data
+    return qualidade.tabela(dados.qualidade_dados(path))
+
+
+def painel_qualidade(estado):
+    if not eh_admin():
+        return
+    with st.sidebar.expander("Qualidade dos dados"):
+        st.dataframe(
+            relatorio_qualidade(DATA_PATH, estado),
+            use_container_width=True,
+            hide_index=True,
         )
 
-    # ==========================
-    # Sidebar - Filtros (válidos para TODAS as abas)
-    # ==========================
-    st.sidebar.header("Filtros")
 
-    filtered_df = df.copy()
+TAMANHOS_PAGINA = [50, 100, 500, 1000]
 
-    # --- Filtro de Município (multiselect) ---
-    if "SEQ_MUNICIPIO3" in df.columns and "NOM_MUNICIPIO" in df.columns:
-               
-        municipio_dict,municipio_options=gerarFiltroMunicipio(df)
-        selected_municipios = st.sidebar.multiselect(
-            "Município",
-            options=municipio_options,
-            default=municipio_options,  # todos selecionados por padrão (inclusive SEM_MUNICIPIO se existir)
-            format_func=lambda x: format_municipio_opt(x, municipio_dict),
-        )
-        if selected_municipios:
-            filtered_df = filtrarMunicipio(selected_municipios,filtered_df)
-            
-    # --- Filtro de Motivo do Alvará (multiselect) ---
-    motivo_options = []
-    if "SEQ_MOTIVO_EXPEDICAO_ALVARA" in df.columns:
-        motivos_presentes,motivo_options=gerarFiltroMotivo(df)
-    selected_motivos = st.sidebar.multiselect(
-        "Motivo do Alvará",
-        options=motivo_options,
-        default=motivo_options,  # todos selecionados por padrão (incluindo SEM_MOTIVO se existir)
-        format_func=lambda x: format_motivo_opt(x),
-    )
-    if selected_motivos and "SEQ_MOTIVO_EXPEDICAO_ALVARA" in filtered_df.columns:
-        filtered_df=filtrarMotivo(selected_motivos,filtered_df)
 
-# --- Filtro de Motivo do Status (multiselect) ---
-    status_options = []
-    if "SEQ_STATUS" in df.columns:
-        status_presentes,status_options=gerarFiltroStatus(df)
-        selected_status = st.sidebar.multiselect(
-        "Status Pessoa",
-        options=status_options,
-        default=status_options,  # todos selecionados por padrão (incluindo SEM_STATUS se existir)
-        format_func=lambda x: format_status_opt(x),
+def tabela_paginada(conjunto, resultado, qtd_registros, colunas):
+    # Tabela da ABA 1 em páginas: ordenação e seleção de colunas são feitas
+    # no servidor e só as linhas da página atual são copiadas e enviadas
+    # ao navegador
+    c1, c2, c3, c4 = st.columns([3, 2, 1, 1])
+    colunas_tabela = c1.multiselect("Colunas", options=colunas, default=colunas)
+    ordenar_por = c2.selectbox(
+        "Ordenar por",
+        options=[None] + list(colunas),
+        format_func=lambda col: "(ordem do extrato)" if col is None else col,
     )
-    if selected_status :
-        filtered_df=filtrarStatus(selected_status,filtered_df)
-     
+    decrescente = c3.checkbox("Decrescente", disabled=ordenar_por is None)
+    tamanho_pagina = c4.selectbox("Linhas por página", TAMANHOS_PAGINA, index=1)
+
+    n_paginas = max(1, -(-qtd_registros // tamanho_pagina))
+    pagina = st.number_input("Página", min_value=1, max_value=n_paginas, value=1)
+    inicio = (pagina - 1) * tamanho_pagina
+    fim = min(inicio + tamanho_pagina, qtd_registros)
+
+    with etapa("aba1_tabela", qtd_registros) as medida:
+        posicoes = resultado.posicoes
+        if ordenar_por is None:
+            posicoes = posicoes[:qtd_registros]
+        else:
+            # Mesmos registros do slider (os primeiros na ordem do extrato),
+            # na ordem pedida
+            ordenadas = resultado.ordenadas(ordenar_por, decrescente)
+            if qtd_registros < len(posicoes):
+                ordenadas = ordenadas[ordenadas <= posicoes[qtd_registros - 1]]
+            posicoes = ordenadas
+
+        df_pagina = conjunto.linhas(posicoes[inicio:fim], colunas_tabela or None)
+        st.dataframe(df_pagina, use_container_width=True)
+    medida.linhas_saida = len(df_pagina)
+    medida.bytes = medicao.bytes_dataframe(df_pagina)
+    st.caption(f"Registros {inicio + 1} a {fim} de {qtd_registros} (página {pagina} de {n_paginas})")
+
+
+# --------------------------
+# ABA 1
+# --------------------------
+@st.fragment
+@com_medicao("aba1")
+@com_dados_atuais
+def aba_visao_geral(conjunto, resultado, colunas):
+    posicoes = resultado.posicoes
+    st.subheader("Peças de Pessoas Moradoras de Rua - Visão Geral")
+
+    if len(posicoes) == 0:
+        st.warning("Nenhum registro encontrado com os filtros selecionados.")
+    else:
+        max_registros = len(posicoes)
+        qtd_registros = st.slider(
+            "Quantidade de registros a exibir na tabela e no gráfico:",
+            min_value=1,
+            max_value=max_registros,
+            value=max_registros,
+        )
 
-    # ==========================
-    # Layout principal - Abas
-    # ==========================
-    st.title("Dashboard - Peças Jurídicas de Pessoas em Situação de Rua")
+        st.markdown("### Tabela de dados (amostra filtrada)")
+        tabela_paginada(conjunto, resultado, qtd_registros, colunas)
+        botao_exportacao(
+            f"Baixar os {max_registros} registros filtrados",
+            "bnmp_filtrado",
+            lambda: exportar.lotes(conjunto, resultado.posicoes),
+            key="exportar_registros",
+        )
 
-    tab1, tab2, tab3 = st.tabs(
-        [
-            "ABA 1 - Visão Geral das Peças",
-            "ABA 2 - Peças por Motivo do Alvará",
-            "ABA 3 - Peças por Município",
-        ]
-    )
+        # Métricas dos registros exibidos: com todos os registros filtrados
+        # na tela, saem direto do cubo; senão, das somas acumuladas do
+        # resultado (tempo constante por posição do slider)
+        with etapa("aba1_resumo", qtd_registros):
+            resumo = nucleo.visao_geral(resultado, qtd_registros)
+        total_pecas = resumo["total_pecas"]
+        qtd_sem_alvara = resumo["qtd_sem_alvara"]
+        qtd_com_alvara = resumo["qtd_com_alvara"]
+
+        # Métricas principais
+        st.markdown("### Métricas principais (considerando os registros exibidos)")
+
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Total de peças", int(total_pecas))
+        col2.metric("Peças **sem** alvará de soltura", int(qtd_sem_alvara))
+        col3.metric("Peças **com** alvará de soltura", int(qtd_com_alvara))
+
+        # Métricas adicionais
+        municipios_distintos = resumo["municipios_distintos"]
+        motivos_distintos = resumo["motivos_distintos"]
+        pct_com_alvara = resumo["pct_com_alvara"]
+        pct_sem_alvara = resumo["pct_sem_alvara"]
+
+        st.markdown("### Métricas adicionais")
+        c4, c5, c6 = st.columns(3)
+        c4.metric("Municípios distintos (na amostra)", int(municipios_distintos))
+        c5.metric("Motivos distintos de alvará (na amostra)", int(motivos_distintos))
+        c6.metric(
+            "% com alvará / sem alvará",
+            f"{pct_com_alvara}% / {pct_sem_alvara}%",
+        )
 
-    # --------------------------
-    # ABA 1
-    # --------------------------
-    with tab1:
-        st.subheader("Peças de Pessoas Moradoras de Rua - Visão Geral")
+        # DataFrame para gráfico de barras
+        resumo_df = nucleo.grafico_resumo(resumo)
 
-        if filtered_df.empty:
-            st.warning("Nenhum registro encontrado com os filtros selecionados.")
-        else:
-            max_registros = len(filtered_df)
-            qtd_registros = st.slider(
-                "Quantidade de registros a exibir na tabela e no gráfico:",
-                min_value=1,
-                max_value=max_registros,
-                value=max_registros,
+        st.markdown("### Gráfico de barras - Resumo de peças")
+        with etapa("aba1_grafico", len(resumo_df)) as medida:
+            chart_resumo = graficos.barras_resumo(resumo_df)
+            st.altair_chart(chart_resumo, use_container_width=True)
+        medida.bytes = medicao.bytes_grafico(chart_resumo)
+
+
+# --------------------------
+# ABA 2
+# --------------------------
+@st.fragment
+@com_medicao("aba2")
+@com_dados_atuais
+def aba_motivos(resultado, colunas):
+    st.subheader("Peças de Pessoas Moradoras de Rua - Por Motivo do Alvará")
+
+    if resultado.n_linhas == 0:
+        st.warning("Nenhum registro encontrado com os filtros selecionados.")
+    else:
+        if "SEQ_MOTIVO_EXPEDICAO_ALVARA" not in colunas:
+            st.error(
+                "Coluna 'SEQ_MOTIVO_EXPEDICAO_ALVARA' não encontrada no conjunto de dados."
             )
+        else:
+            # Soma das células do cubo por motivo, já ordenada pela
+            # quantidade. Inclui os sem motivo e o "Não informado / Outro"
+            with etapa("aba2_contagem", resultado.n_linhas) as medida:
+                aba2 = nucleo.por_motivo(resultado)
+            medida.linhas_saida = aba2["n_motivos"]
+            motivo_counts = aba2["contagens"]
+
+            col_a, col_b, col_c = st.columns(3)
+            col_a.metric("Total de peças (pós-filtro)", aba2["total_pecas"])
+            col_b.metric("Nº de motivos diferentes", aba2["n_motivos"])
+
+            if aba2["mais_frequente"] is not None:
+                label_top, top_qtd = aba2["mais_frequente"]
+                col_c.metric(
+                    "Motivo mais frequente",
+                    label_top,
+                    f"{top_qtd} peças",
+                )
 
-            df_exibicao = filtered_df.head(qtd_registros)
+            st.markdown("### Quantidade de peças por motivo de expedição do alvará")
 
-            st.markdown("### Tabela de dados (amostra filtrada)")
-            st.dataframe(df_exibicao, use_container_width=True)
+            # O gráfico recebe só os N motivos com mais peças e uma barra
+            # "Outros" com o restante; a tabela completa fica abaixo
+            top_motivos = st.number_input(
+                "Motivos no gráfico", min_value=1, value=graficos.TOP_GRAFICOS, key="top_motivos"
+            )
+            with etapa("aba2_grafico", aba2["n_motivos"]) as medida:
+                chart_motivo = graficos.barras_motivos(motivo_counts, top_motivos)
+                st.altair_chart(chart_motivo, use_container_width=True)
+            medida.bytes = medicao.bytes_grafico(chart_motivo)
+
+            st.markdown("### Tabela de apoio (motivo x quantidade)")
+            if st.checkbox("Mostrar tabela completa", key="tabela_motivos"):
+                with etapa("aba2_tabela", len(motivo_counts)) as medida:
+                    st.dataframe(motivo_counts, use_container_width=True)
+                medida.bytes = medicao.bytes_dataframe(motivo_counts)
+            botao_exportacao(
+                "Baixar tabela de apoio", "bnmp_por_motivo", lambda: [motivo_counts], key="exportar_motivos"
+            )
 
-            # Cálculo das quantidades para o gráfico de barras
-            if "SEQ_PECA" in df_exibicao.columns:
-                total_pecas = df_exibicao["SEQ_PECA"].count()
-            else:
-                total_pecas = len(df_exibicao)
 
-            if "SEQ_ALVARA_SOLTURA" in df_exibicao.columns:
-                seq_alvara = df_exibicao["SEQ_ALVARA_SOLTURA"]
-                sem_alvara_mask = seq_alvara.isna() | (
-                    seq_alvara.astype(str).str.strip() == ""
-                )
-                qtd_sem_alvara = int(sem_alvara_mask.sum())
-                qtd_com_alvara = int(len(df_exibicao) - qtd_sem_alvara)
-            else:
-                qtd_sem_alvara = 0
-                qtd_com_alvara = 0
-
-            # Métricas principais
-            st.markdown("### Métricas principais (considerando os registros exibidos)")
-
-            col1, col2, col3 = st.columns(3)
-            col1.metric("Total de peças", int(total_pecas))
-            col2.metric("Peças **sem** alvará de soltura", int(qtd_sem_alvara))
-            col3.metric("Peças **com** alvará de soltura", int(qtd_com_alvara))
-
-            # Métricas adicionais
-            municipios_distintos = (
-                df_exibicao["SEQ_MUNICIPIO3"].nunique()
-                if "SEQ_MUNICIPIO3" in df_exibicao.columns
-                else 0
-            )
-            motivos_distintos = (
-                df_exibicao["SEQ_MOTIVO_EXPEDICAO_ALVARA"].nunique()
-                if "SEQ_MOTIVO_EXPEDICAO_ALVARA" in df_exibicao.columns
-                else 0
+# --------------------------
+# ABA 3
+# --------------------------
+@st.fragment
+@com_medicao("aba3")
+@com_dados_atuais
+def aba_municipios(resultado, colunas):
+    st.subheader("Peças de Pessoas Moradoras de Rua - Por Município")
+
+    if resultado.n_linhas == 0:
+        st.warning("Nenhum registro encontrado com os filtros selecionados.")
+    else:
+        if ("SEQ_MUNICIPIO3" not in colunas) or (
+            "NOM_MUNICIPIO" not in colunas
+        ):
+            st.error(
+                "Colunas 'SEQ_MUNICIPIO3' e/ou 'NOM_MUNICIPIO' não encontradas no conjunto de dados."
             )
-            pct_com_alvara = (
-                round(qtd_com_alvara * 100 / total_pecas, 1)
-                if total_pecas > 0
-                else 0.0
+        else:
+            # Soma das células do cubo por município (código e nome), já
+            # ordenada; os sem nome vêm como "Sem município informado"
+            with etapa("aba3_contagem", resultado.n_linhas) as medida:
+                aba3 = nucleo.por_municipio(resultado)
+            medida.linhas_saida = aba3["n_municipios"]
+            muni_counts = aba3["contagens"]
+
+            col_m1, col_m2, col_m3 = st.columns(3)
+            col_m1.metric("Total de peças (pós-filtro)", aba3["total_pecas"])
+            col_m2.metric("Nº de municípios (pós-filtro)", aba3["n_municipios"])
+
+            if aba3["mais_frequente"] is not None:
+                label_muni, top_qtd = aba3["mais_frequente"]
+                col_m3.metric(
+                    "Município com mais peças",
+                    label_muni,
+                    f"{top_qtd} peças",
+                )
+
+            st.markdown("### Quantidade de peças por município")
+
+            top_munis = st.number_input(
+                "Municípios no gráfico", min_value=1, value=graficos.TOP_GRAFICOS, key="top_munis"
             )
-            pct_sem_alvara = (
-                round(qtd_sem_alvara * 100 / total_pecas, 1)
-                if total_pecas > 0
-                else 0.0
+            with etapa("aba3_grafico", aba3["n_municipios"]) as medida:
+                chart_muni = graficos.barras_municipios(muni_counts, top_munis)
+                st.altair_chart(chart_muni, use_container_width=True)
+            medida.bytes = medicao.bytes_grafico(chart_muni)
+
+            st.markdown("### Tabela de apoio (município x quantidade)")
+            if st.checkbox("Mostrar tabela completa", key="tabela_munis"):
+                with etapa("aba3_tabela", len(muni_counts)) as medida:
+                    st.dataframe(muni_counts, use_container_width=True)
+                medida.bytes = medicao.bytes_dataframe(muni_counts)
+            botao_exportacao(
+                "Baixar tabela de apoio", "bnmp_por_municipio", lambda: [muni_counts], key="exportar_municipios"
             )
 
-            st.markdown("### Métricas adicionais")
-            c4, c5, c6 = st.columns(3)
-            c4.metric("Municípios distintos (na amostra)", int(municipios_distintos))
-            c5.metric("Motivos distintos de alvará (na amostra)", int(motivos_distintos))
-            c6.metric(
-                "% com alvará / sem alvará",
-                f"{pct_com_alvara}% / {pct_sem_alvara}%",
-            )
 
-            # DataFrame para gráfico de barras
-            resumo_df = pd.DataFrame(
-                {
-                    "Categoria": [
-                        "Total de peças",
-                        "Peças sem alvará de soltura",
-                        "Peças com alvará de soltura",
-                    ],
-                    "Quantidade": [total_pecas, qtd_sem_alvara, qtd_com_alvara],
-                }
-            )
+ABAS = [
+    "ABA 1 - Visão Geral das Peças",
+    "ABA 2 - Peças por Motivo do Alvará",
+    "ABA 3 - Peças por Município",
+]
 
-            st.markdown("### Gráfico de barras - Resumo de peças")
-            chart_resumo = (
-                alt.Chart(resumo_df)
-                .mark_bar()
-                .encode(
-                    x=alt.X("Categoria:N", sort=None, title="Categoria"),
-                    y=alt.Y("Quantidade:Q", title="Quantidade"),
-                    tooltip=["Categoria", "Quantidade"],
-                )
-            )
-            st.altair_chart(chart_resumo, use_container_width=True)
 
-    # --------------------------
-    # ABA 2
-    # --------------------------
-    with tab2:
-        st.subheader("Peças de Pessoas Moradoras de Rua - Por Motivo do Alvará")
+@com_medicao("app")
+@com_dados_atuais
+def main():
+    estado = estado_atual()
+    with etapa("load_data") as medida:
+        conjunto = load_data(DATA_PATH, estado)
+    medida.linhas_saida = conjunto.n_linhas
 
-        if filtered_df.empty:
-            st.warning("Nenhum registro encontrado com os filtros selecionados.")
-        else:
-            if "SEQ_MOTIVO_EXPEDICAO_ALVARA" not in filtered_df.columns:
-                st.error(
-                    "Coluna 'SEQ_MOTIVO_EXPEDICAO_ALVARA' não encontrada no conjunto de dados."
-                )
-            else:
-                # Agrupa por motivo, contando quantidade de peças
-                if "SEQ_PECA" in filtered_df.columns:
-                    motivo_counts = (
-                        filtered_df.groupby(
-                            [
-                                "SEQ_MOTIVO_EXPEDICAO_ALVARA",
-                                "DSC_MOTIVO_EXPEDICAO_ALVARA",
-                            ],
-                            dropna=False  # mantém também os sem motivo
-                        )
-                        .agg(qtd_pecas=("SEQ_PECA", "count"))
-                        .reset_index()
-                    )
-                else:
-                    motivo_counts = (
-                        filtered_df.groupby(
-                            [
-                                "SEQ_MOTIVO_EXPEDICAO_ALVARA",
-                                "DSC_MOTIVO_EXPEDICAO_ALVARA",
-                            ],
-                            dropna=False
-                        )
-                        .size()
-                        .reset_index(name="qtd_pecas")
-                    )
-
-                # NÃO remover NaN aqui; queremos mostrar também o "Não informado / Outro"
-                motivo_counts = motivo_counts.sort_values(
-                    "qtd_pecas", ascending=False
-                )
+    # DSC_MOTIVO_EXPEDICAO_ALVARA, DSC_STATUS, DSC_MUNICIPIO e TEM_ALVARA já
+    # vêm calculadas da carga (dados.derivar) e são somente leitura aqui
+    colunas = conjunto.colunas
 
-                # Métricas para a aba 2
-                total_pecas_tab2 = int(motivo_counts["qtd_pecas"].sum())
-                num_motivos_tab2 = int(len(motivo_counts))
-
-                col_a, col_b, col_c = st.columns(3)
-                col_a.metric("Total de peças (pós-filtro)", total_pecas_tab2)
-                col_b.metric("Nº de motivos diferentes", num_motivos_tab2)
-
-                if not motivo_counts.empty:
-                    top_row = motivo_counts.iloc[0]
-                    top_cod = top_row["SEQ_MOTIVO_EXPEDICAO_ALVARA"]
-                    top_desc = top_row["DSC_MOTIVO_EXPEDICAO_ALVARA"]
-                    top_qtd = int(top_row["qtd_pecas"])
-
-                    # se top_cod é nulo, tratamos como "Sem motivo"
-                    if pd.isna(top_cod):
-                        label_top = "SEM MOTIVO INFORMADO"
-                    else:
-                        label_top = f"{int(top_cod)} - {top_desc}"
-
-                    col_c.metric(
-                        "Motivo mais frequente",
-                        label_top,
-                        f"{top_qtd} peças",
-                    )
-
-                st.markdown("### Quantidade de peças por motivo de expedição do alvará")
-
-                chart_motivo = (
-                    alt.Chart(motivo_counts)
-                    .mark_bar()
-                    .encode(
-                        x=alt.X(
-                            "DSC_MOTIVO_EXPEDICAO_ALVARA:N",
-                            sort="-y",
-                            title="Motivo de expedição do alvará",
-                        ),
-                        y=alt.Y("qtd_pecas:Q", title="Quantidade de peças"),
-                        tooltip=[
-                            alt.Tooltip(
-                                "SEQ_MOTIVO_EXPEDICAO_ALVARA:Q",
-                                title="Código do motivo",
-                            ),
-                            alt.Tooltip(
-                                "DSC_MOTIVO_EXPEDICAO_ALVARA:N", title="Motivo"
-                            ),
-                            alt.Tooltip("qtd_pecas:Q", title="Quantidade de peças"),
-                        ],
-                    )
-                    .properties(height=500)
-                )
+    # Opções e rótulos dos filtros vêm prontos do conjunto (calculados uma
+    # vez por versão dos dados); aqui só se desenha a barra lateral
+    opcoes = nucleo.opcoes(conjunto)
 
-                st.altair_chart(chart_motivo, use_container_width=True)
+    # ==========================
+    # Sidebar - Filtros (válidos para TODAS as abas)
+    # ==========================
+    st.sidebar.header("Filtros")
 
-                st.markdown("### Tabela de apoio (motivo x quantidade)")
-                st.dataframe(motivo_counts, use_container_width=True)
+    # Os multiselects ficam num formulário: as escolhas só valem (e só
+    # disparam uma execução) ao clicar em "Aplicar filtros", então montar
+    # uma seleção com vários itens custa uma consulta, não uma por clique
+    form_filtros = st.sidebar.form("filtros")
 
-    # --------------------------
-    # ABA 3
-    # --------------------------
-    with tab3:
-        st.subheader("Peças de Pessoas Moradoras de Rua - Por Município")
+    # coluna -> opções selecionadas; aplicadas todas de uma vez no final
+    selecoes = {}
 
-        if filtered_df.empty:
-            st.warning("Nenhum registro encontrado com os filtros selecionados.")
-        else:
-            if ("SEQ_MUNICIPIO3" not in filtered_df.columns) or (
-                "NOM_MUNICIPIO" not in filtered_df.columns
-            ):
-                st.error(
-                    "Colunas 'SEQ_MUNICIPIO3' e/ou 'NOM_MUNICIPIO' não encontradas no conjunto de dados."
-                )
-            else:
-                # Para municípios sem nome, preenchermos "Sem município informado" para exibição
-                muni_work = filtered_df.copy()
-                muni_work["NOM_MUNICIPIO"] = muni_work["NOM_MUNICIPIO"].fillna(
-                    "Sem município informado"
-                )
+    # --- Filtro de Município (multiselect) ---
+    if "SEQ_MUNICIPIO3" in opcoes and "NOM_MUNICIPIO" in colunas:
+        filtro = opcoes["SEQ_MUNICIPIO3"]
+        selected_municipios = form_filtros.multiselect(
+            "Município",
+            options=filtro.opcoes,
+            default=filtro.opcoes,  # todos selecionados por padrão (inclusive SEM_MUNICIPIO se existir)
+            format_func=filtro.rotulos.get,
+        )
+        selecoes["SEQ_MUNICIPIO3"] = selected_municipios
+            
+    # --- Filtro de Motivo do Alvará (multiselect) ---
+    motivo_options = []
+    motivo_rotulos = {}
+    if "SEQ_MOTIVO_EXPEDICAO_ALVARA" in opcoes:
+        motivo_options = opcoes["SEQ_MOTIVO_EXPEDICAO_ALVARA"].opcoes
+        motivo_rotulos = opcoes["SEQ_MOTIVO_EXPEDICAO_ALVARA"].rotulos
+    selected_motivos = form_filtros.multiselect(
+        "Motivo do Alvará",
+        options=motivo_options,
+        default=motivo_options,  # todos selecionados por padrão (incluindo SEM_MOTIVO se existir)
+        format_func=motivo_rotulos.get,
+    )
+    if "SEQ_MOTIVO_EXPEDICAO_ALVARA" in opcoes:
+        selecoes["SEQ_MOTIVO_EXPEDICAO_ALVARA"] = selected_motivos
 
-                # Agrupa por município, contando quantidade de peças
-                group_cols = ["SEQ_MUNICIPIO3", "NOM_MUNICIPIO"]
-                if "SEQ_PECA" in muni_work.columns:
-                    muni_counts = (
-                        muni_work.groupby(group_cols, dropna=False)
-                        .agg(qtd_pecas=("SEQ_PECA", "count"))
-                        .reset_index()
-                    )
-                else:
-                    muni_counts = (
-                        muni_work.groupby(group_cols, dropna=False)
-                        .size()
-                        .reset_index(name="qtd_pecas")
-                    )
-
-                muni_counts = muni_counts.sort_values("qtd_pecas", ascending=False)
-
-                total_pecas_muni = int(muni_counts["qtd_pecas"].sum())
-                num_munis = int(len(muni_counts))
-
-                col_m1, col_m2, col_m3 = st.columns(3)
-                col_m1.metric("Total de peças (pós-filtro)", total_pecas_muni)
-                col_m2.metric("Nº de municípios (pós-filtro)", num_munis)
-
-                if not muni_counts.empty:
-                    top_row = muni_counts.iloc[0]
-                    top_nome = top_row["NOM_MUNICIPIO"]
-                    top_cod = top_row["SEQ_MUNICIPIO3"]
-                    top_qtd = int(top_row["qtd_pecas"])
-
-                    if pd.isna(top_cod):
-                        label_muni = f"SEM MUNICÍPIO - {top_nome}"
-                    else:
-                        label_muni = f"{int(top_cod)} - {top_nome}"
-
-                    col_m3.metric(
-                        "Município com mais peças",
-                        label_muni,
-                        f"{top_qtd} peças",
-                    )
-
-                st.markdown("### Quantidade de peças por município")
-
-                chart_muni = (
-                    alt.Chart(muni_counts)
-                    .mark_bar()
-                    .encode(
-                        x=alt.X(
-                            "NOM_MUNICIPIO:N",
-                            sort="-y",
-                            title="Município",
-                        ),
-                        y=alt.Y("qtd_pecas:Q", title="Quantidade de peças"),
-                        tooltip=[
-                            alt.Tooltip("SEQ_MUNICIPIO3:Q", title="Código do Município"),
-                            alt.Tooltip("NOM_MUNICIPIO:N", title="Município"),
-                            alt.Tooltip("qtd_pecas:Q", title="Quantidade de peças"),
-                        ],
-                    )
-                    .properties(height=500)
-                )
+# --- Filtro de Motivo do Status (multiselect) ---
+    if "SEQ_STATUS" in opcoes:
+        filtro = opcoes["SEQ_STATUS"]
+        selected_status = form_filtros.multiselect(
+            "Status Pessoa",
+            options=filtro.opcoes,
+            default=filtro.opcoes,  # todos selecionados por padrão (incluindo SEM_STATUS se existir)
+            format_func=filtro.rotulos.get,
+        )
+        selecoes["SEQ_STATUS"] = selected_status
+
+    form_filtros.form_submit_button("Aplicar filtros", type="primary")
+
+    painel_desempenho()
+    painel_qualidade(estado)
+
+    # Os três filtros viram operações sobre o índice pré-calculado (lista
+    # vazia = sem filtro naquela coluna). O resultado (posições das linhas
+    # e agregados das abas) vem do cache LRU do conjunto quando essa
+    # combinação de filtros já foi consultada; a sessão nunca copia a tabela.
+    with etapa("filtros", conjunto.n_linhas) as medida:
+        resultado = nucleo.filtrar(conjunto, selecoes)
+        # O resultado é preguiçoso: a parte que a visão ativa usa (posições
+        # na ABA 1, só a contagem nas outras) é calculada aqui, para o custo
+        # dos filtros entrar nesta etapa
+        if st.session_state.get("aba", ABAS[0]) == ABAS[0]:
+            medida.linhas_saida = len(resultado.posicoes)
+        else:
+            medida.linhas_saida = resultado.n_linhas
 
-                st.altair_chart(chart_muni, use_container_width=True)
+    # ==========================
+    # Layout principal - Abas
+    # ==========================
+    st.title("Dashboard - Peças Jurídicas de Pessoas em Situação de Rua")
 
-                st.markdown("### Tabela de apoio (município x quantidade)")
-                st.dataframe(muni_counts, use_container_width=True)
+    # Só a visão escolhida é calculada e desenhada. Cada visão é um
+    # fragmento: mexer nos controles dela (slider, página, top N) reexecuta
+    # só aquela visão, não os filtros nem as outras abas.
+    aba = st.radio(
+        "Visão",
+        ABAS,
+        horizontal=True,
+        label_visibility="collapsed",
+        key="aba",
+    )
+    if aba == ABAS[0]:
+        aba_visao_geral(conjunto, resultado, colunas)
+    elif aba == ABAS[1]:
+        aba_motivos(resultado, colunas)
+    else:
+        aba_municipios(resultado, colunas)
@@ -0,0 +1,172 @@
+"""Benchmark do núcleo do dashboard sobre extratos sintéticos do BNMP.
+
+Gera CSVs com a mesma estrutura do extrato (distribuições parecidas com
+as reais: poucos municípios concentram a maior parte das peças, motivos e
+status das tabelas de domínio com códigos fora delas e nulos) e mede,
+etapa por etapa, o tempo e o pico de memória das funções de nucleo.py.
+
+Uso:
+    python benchmark.py --linhas 10000 100000 1000000 --diretorio /tmp/bnmp-bench
+
+O pico de memória é o do tracemalloc (Python, pandas e numpy). Buffers do
+Arrow e páginas do cache lidas por memory-map não entram nele; a coluna
+arrow_mb mostra quanto o pool do Arrow tem alocado ao fim de cada etapa.
+"""
+import argparse
+import os
+import shutil
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+import dados
+import nucleo
+from conjunto import BACKEND
+from tabelas import MOTIVO_MAP, STATUS_MAP
+
+N_MUNICIPIOS = 5570
+LINHAS_POR_BLOCO = 500_000
+
+
+# ==========================
+# Extrato sintético
+# ==========================
+def _pesos(n: int, expoente: float) -> np.ndarray:
+    # Distribuição de cauda longa (Zipf) sobre n categorias
+    pesos = 1.0 / np.arange(1, n + 1) ** expoente
+    return pesos / pesos.sum()
+
+
+def gerar_extrato(path: str, n_linhas: int, semente: int = 0) -> None:
+    # Escreve o CSV em blocos, sem montar o extrato inteiro em memória
+    rng = np.random.default_rng(semente)
+    municipios = rng.permutation(np.arange(1_100_015, 1_100_015 + N_MUNICIPIOS))
+    pesos_municipios = _pesos(N_MUNICIPIOS, 1.1)
+    motivos = np.array(list(MOTIVO_MAP) + [999])  # 999: fora da tabela
+    pesos_motivos = _pesos(len(motivos), 0.8)
+    status = np.array(list(STATUS_MAP))
+    pesos_status = _pesos(len(status), 1.2)
+
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        for inicio in range(0, max(n_linhas, 1), LINHAS_POR_BLOCO):
+            n = min(LINHAS_POR_BLOCO, n_linhas - inicio)
+            municipio = pd.array(rng.choice(municipios, n, p=pesos_municipios), dtype="Int64")
+            sem_municipio = rng.random(n) < 0.02
+            municipio[sem_municipio] = pd.NA
+            nome = pd.Series("MUNICIPIO " + municipio.astype(str), dtype=object)
+            nome[sem_municipio | (rng.random(n) < 0.01)] = None
+            com_espacos = nome.notna() & (rng.random(n) < 0.01)
+            nome[com_espacos] += "  "  # espaços nas pontas, como no extrato real
+
+            # Motivo só existe quando há alvará de soltura
+            tem_alvara = rng.random(n) < 0.45
+            alvara = pd.array(np.arange(inicio, inicio + n) + 5_000_000, dtype="Int64")
+            alvara[~tem_alvara] = pd.NA
+            motivo = pd.array(rng.choice(motivos, n, p=pesos_motivos), dtype="Int64")
+            motivo[~tem_alvara | (rng.random(n) < 0.03)] = pd.NA
+            situacao = pd.array(rng.choice(status, n, p=pesos_status), dtype="Int64")
+            situacao[rng.random(n) < 0.01] = pd.NA
+
+            bloco = pd.DataFrame(
+                {
+                    "SEQ_PECA": np.arange(inicio, inicio + n) + 1,
+                    "SEQ_MUNICIPIO3": municipio,
+                    "NOM_MUNICIPIO": nome,
+                    "SEQ_MOTIVO_EXPEDICAO_ALVARA": motivo,
+                    "SEQ_STATUS": situacao,
+                    "SEQ_ALVARA_SOLTURA": alvara,
+                    # Colunas que o dashboard não lê (ver dados.ESQUEMA_BNMP)
+                    "DAT_EXPEDICAO": "2024-01-01",
+                    "DSC_OBSERVACAO": "Peça gerada para benchmark",
+                }
+            )
+            bloco.to_csv(f, sep=";", index=False, header=inicio == 0)
+
+
+# ==========================
+# Medição
+# ==========================
+def medir(medidas: list, n_linhas: int, etapa: str, funcao):
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    valor = funcao()
+    segundos = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    medidas.append(
+        {
+            "linhas": n_linhas,
+            "etapa": etapa,
+            "segundos": round(segundos, 4),
+            "pico_mb": round(pico / 2**20, 1),
+            "arrow_mb": round(pa.total_allocated_bytes() / 2**20, 1),
+        }
+    )
+    return valor
+
+
+def medir_extrato(path: str, n_linhas: int, backend: str) -> list:
+    medidas = []
+    shutil.rmtree(dados.diretorio_cache(path), ignore_errors=True)
+
+    medir(medidas, n_linhas, "carga_fria", lambda: nucleo.carregar(path, backend))
+    conjunto = medir(medidas, n_linhas, "carga_quente", lambda: nucleo.carregar(path, backend))
+    opcoes = medir(medidas, n_linhas, "opcoes", lambda: nucleo.opcoes(conjunto))
+
+    # Seleção típica: 50 municípios, 3 motivos e todos os status
+    selecoes = nucleo.selecoes(
+        municipios=opcoes["SEQ_MUNICIPIO3"].opcoes[:50],
+        motivos=opcoes["SEQ_MOTIVO_EXPEDICAO_ALVARA"].opcoes[:3],
+    )
+    resultado = medir(medidas, n_linhas, "filtrar", lambda: nucleo.filtrar(conjunto, selecoes))
+    medir(medidas, n_linhas, "posicoes", lambda: resultado.posicoes)
+    medir(medidas, n_linhas, "aba1", lambda: nucleo.visao_geral(resultado))
+    medir(
+        medidas,
+        n_linhas,
+        "aba1_slider",
+        lambda: nucleo.visao_geral(resultado, max(resultado.n_linhas // 2, 1)),
+    )
+    medir(medidas, n_linhas, "aba2", lambda: nucleo.por_motivo(resultado))
+    medir(medidas, n_linhas, "aba3", lambda: nucleo.por_municipio(resultado))
+    medir(
+        medidas,
+        n_linhas,
+        "pagina_ordenada",
+        lambda: conjunto.linhas(resultado.ordenadas("SEQ_PECA", True)[:100]),
+    )
+    return medidas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--linhas", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--diretorio", default="bnmp-benchmark")
+    parser.add_argument("--backend", default=BACKEND)
+    parser.add_argument("--semente", type=int, default=0)
+    parser.add_argument("--saida", help="grava as medidas também neste CSV")
+    args = parser.parse_args()
+
+    os.makedirs(args.diretorio, exist_ok=True)
+    medidas = []
+    for n_linhas in args.linhas:
+        path = os.path.join(args.diretorio, f"BNMP_{n_linhas}.CSV")
+        if not os.path.exists(path):
+            inicio = time.perf_counter()
+            gerar_extrato(path, n_linhas, args.semente)
+            print(f"{path}: gerado em {time.perf_counter() - inicio:.1f}s")
+        medidas.extend(medir_extrato(path, n_linhas, args.backend))
+
+    tabela = pd.DataFrame(medidas)
+    print(tabela.to_string(index=False))
+    if args.saida:
+        tabela.to_csv(args.saida, index=False)
+
+
+if __name__ == "__main__":
+    main()
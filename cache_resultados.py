@@ -0,0 +1,68 @@
+"""Cache LRU de resultados de filtragem, limitado por memória.
+
+Compartilhado por todas as sessões do processo (por isso protegido por uma
+trava). Cada entrada informa o próprio tamanho em bytes por ``nbytes()``.
+Como os resultados podem calcular partes sob demanda depois de entrarem no
+cache, eles chamam ``remedir()`` quando crescem.
+"""
+import threading
+from collections import OrderedDict
+
+
+class CacheResultados:
+    def __init__(self, limite_bytes: int):
+        self.limite_bytes = limite_bytes
+        self.acertos = 0
+        self.falhas = 0
+        self._itens = OrderedDict()  # chave -> (valor, bytes)
+        self._bytes = 0
+        self._trava = threading.Lock()
+
+    def obter(self, chave, calcular):
+        with self._trava:
+            if chave in self._itens:
+                self.acertos += 1
+                valor, _ = self._itens[chave]
+                self._itens.move_to_end(chave)
+                self._medir(chave)
+                return valor
+            self.falhas += 1
+
+        # Calcula fora da trava para não bloquear as outras sessões
+        valor = calcular()
+        with self._trava:
+            if chave not in self._itens:
+                self._itens[chave] = (valor, 0)
+            self._medir(chave)
+        return valor
+
+    def remedir(self, chave) -> None:
+        with self._trava:
+            if chave in self._itens:
+                self._medir(chave)
+
+    def _medir(self, chave) -> None:
+        # Atualiza o tamanho da entrada e descarta as menos usadas até caber
+        # no limite (a entrada mais recente sempre fica)
+        valor, anterior = self._itens[chave]
+        atual = valor.nbytes()
+        self._itens[chave] = (valor, atual)
+        self._bytes += atual - anterior
+        while self._bytes > self.limite_bytes and len(self._itens) > 1:
+            _, (_, tamanho) = self._itens.popitem(last=False)
+            self._bytes -= tamanho
+
+    def limpar(self) -> None:
+        with self._trava:
+            self._itens.clear()
+            self._bytes = 0
+
+    def estatisticas(self) -> dict:
+        with self._trava:
+            return {
+                "acertos": self.acertos,
+                "falhas": self.falhas,
+                "itens": len(self._itens),
+                "bytes": self._bytes,
+                "limite_bytes": self.limite_bytes,
+            }
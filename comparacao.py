@@ -0,0 +1,193 @@
+"""Comparação entre dois extratos do BNMP (datas de extração diferentes).
+
+As peças são casadas por SEQ_PECA e cada linha vira um digesto de 64 bits
+das colunas lidas do CSV (ver dados.ESQUEMA_BNMP), então uma peça
+"alterada" é só a que tem digesto diferente nos dois extratos. Os dois
+extratos são lidos dos seus caches colunares (montados se preciso) e o
+casamento é por hash: o tempo é linear no número de linhas.
+
+Saída: peças adicionadas, removidas e alteradas, as que ganharam (ou
+perderam) alvará de soltura e as transições de SEQ_STATUS por município,
+com matrizes de transição rotuladas pelo STATUS_MAP.
+
+Uso:
+    python comparacao.py BNMP_2024-01.CSV BNMP_2024-02.CSV --saida diferencas
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+import dados
+from indice import ROTULO_SEM_VALOR
+from tabelas import NAO_INFORMADO, STATUS_MAP
+
+# Colunas do cache que não entram no digesto, mas são usadas no relatório
+COLUNAS_APOIO = ["DSC_MUNICIPIO"]
+
+
+# ==========================
+# Leitura
+# ==========================
+def ler_extrato(path: str) -> pd.DataFrame:
+    # CSV ou diretório de partições, pelas colunas do CSV e as de apoio. Sem
+    # SEQ_PECA a linha não tem como ser casada e fica de fora; SEQ_PECA
+    # repetido vale pela última ocorrência (a mais recente no extrato)
+    paths = dados.arquivos_particoes(path) if os.path.isdir(path) else [path]
+    partes = []
+    for parte in paths:
+        tabela, _, _ = dados.carregar_extrato(parte)
+        colunas = [
+            col
+            for col in list(dados.ESQUEMA_BNMP) + COLUNAS_APOIO
+            if col in tabela.column_names
+        ]
+        partes.append(dados.para_pandas(tabela.select(colunas)))
+    df = pd.concat(partes, ignore_index=True) if len(partes) > 1 else partes[0]
+    if "SEQ_PECA" not in df.columns:
+        raise ValueError(f"Coluna 'SEQ_PECA' não encontrada em {path}")
+    df = df[df["SEQ_PECA"].notna()]
+    return df.drop_duplicates("SEQ_PECA", keep="last").reset_index(drop=True)
+
+
+def digestos(df: pd.DataFrame, colunas: list) -> np.ndarray:
+    # Um uint64 por linha. Códigos vão para Int64 (o cache pode ter tipado
+    # a mesma coluna como Int16 num extrato e Int32 no outro); textos são
+    # comparados pelo valor, seja categoria ou texto
+    normal = df[colunas].astype(
+        {col: "Int64" for col in colunas if pd.api.types.is_integer_dtype(df[col])}
+    )
+    return pd.util.hash_pandas_object(normal, index=False).to_numpy()
+
+
+# ==========================
+# Comparação
+# ==========================
+def comparar(path_antigo: str, path_novo: str) -> dict:
+    antigo = ler_extrato(path_antigo)
+    novo = ler_extrato(path_novo)
+
+    # Posição de cada peça antiga no extrato novo (-1 = removida)
+    pos = pd.Index(novo["SEQ_PECA"].to_numpy(np.int64)).get_indexer(
+        antigo["SEQ_PECA"].to_numpy(np.int64)
+    )
+    em_ambos = pos >= 0
+    pos_ambos = pos[em_ambos]
+    no_antigo = np.zeros(len(novo), dtype=bool)
+    no_antigo[pos_ambos] = True
+
+    colunas = [
+        col
+        for col in dados.ESQUEMA_BNMP
+        if col != "SEQ_PECA" and col in antigo.columns and col in novo.columns
+    ]
+    alterada = (
+        digestos(antigo, colunas)[em_ambos] != digestos(novo, colunas)[pos_ambos]
+    )
+
+    def par(col):
+        # (valores no extrato antigo, no novo) das peças presentes nos dois
+        return (
+            antigo[col][em_ambos].reset_index(drop=True),
+            novo[col].take(pos_ambos).reset_index(drop=True),
+        )
+
+    contagens = {
+        "pecas_antigo": len(antigo),
+        "pecas_novo": len(novo),
+        "adicionadas": int((~no_antigo).sum()),
+        "removidas": int((~em_ambos).sum()),
+        "alteradas": int(alterada.sum()),
+        "inalteradas": int((~alterada).sum()),
+    }
+    if "SEQ_ALVARA_SOLTURA" in colunas:
+        antes, depois = par("SEQ_ALVARA_SOLTURA")
+        contagens["ganharam_alvara"] = int((antes.isna() & depois.notna()).sum())
+        contagens["perderam_alvara"] = int((antes.notna() & depois.isna()).sum())
+
+    pecas = pd.concat(
+        [
+            pd.DataFrame({"SEQ_PECA": novo["SEQ_PECA"][~no_antigo], "situacao": "adicionada"}),
+            pd.DataFrame({"SEQ_PECA": antigo["SEQ_PECA"][~em_ambos], "situacao": "removida"}),
+            pd.DataFrame({"SEQ_PECA": antigo["SEQ_PECA"][em_ambos][alterada], "situacao": "alterada"}),
+        ],
+        ignore_index=True,
+    )
+
+    transicoes = pd.DataFrame()
+    if "SEQ_STATUS" in colunas:
+        # Peças presentes nos dois extratos, pelo município do extrato novo
+        transicoes = {
+            col: par(col)[1]
+            for col in ("SEQ_MUNICIPIO3", "DSC_MUNICIPIO")
+            if col in novo.columns
+        }
+        transicoes["STATUS_ANTES"], transicoes["STATUS_DEPOIS"] = par("SEQ_STATUS")
+        transicoes = pd.DataFrame(transicoes)
+        transicoes = (
+            transicoes.groupby(list(transicoes.columns), dropna=False, observed=True)
+            .size()
+            .rename("qtd_pecas")
+            .reset_index()
+        )
+
+    return {"contagens": contagens, "pecas": pecas, "transicoes": transicoes}
+
+
+def rotulo_status(codigo) -> str:
+    # Mesmo rótulo das opções do filtro de status
+    if pd.isna(codigo):
+        return ROTULO_SEM_VALOR["SEQ_STATUS"]
+    return f"{int(codigo)} - {STATUS_MAP.get(codigo, NAO_INFORMADO)}"
+
+
+def matriz_transicoes(transicoes: pd.DataFrame, municipio=None) -> pd.DataFrame:
+    # Status no extrato antigo (linhas) x no novo (colunas), de todos os
+    # municípios ou de um só (código; "SEM_MUNICIPIO" = sem código)
+    if municipio == "SEM_MUNICIPIO":
+        transicoes = transicoes[transicoes["SEQ_MUNICIPIO3"].isna()]
+    elif municipio is not None:
+        transicoes = transicoes[transicoes["SEQ_MUNICIPIO3"] == municipio]
+    # Agrupa pelos códigos (ordem numérica, sem status no fim) e só então
+    # troca os códigos pelos rótulos
+    matriz = (
+        transicoes.groupby(["STATUS_ANTES", "STATUS_DEPOIS"], dropna=False)["qtd_pecas"]
+        .sum()
+        .unstack(fill_value=0)
+    )
+    matriz.index = matriz.index.map(rotulo_status)
+    matriz.columns = matriz.columns.map(rotulo_status)
+    matriz.index.name = "Status antes"
+    matriz.columns.name = "Status depois"
+    return matriz
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("antigo", help="extrato mais antigo (CSV ou diretório)")
+    parser.add_argument("novo", help="extrato mais recente (CSV ou diretório)")
+    parser.add_argument(
+        "--municipio", type=int, help="matriz de transições só deste município"
+    )
+    parser.add_argument(
+        "--saida", help="grava pecas.parquet e transicoes.parquet neste diretório"
+    )
+    args = parser.parse_args()
+
+    diferencas = comparar(args.antigo, args.novo)
+    for chave, qtd in diferencas["contagens"].items():
+        print(f"{chave}: {qtd}")
+    if not diferencas["transicoes"].empty:
+        print()
+        print(matriz_transicoes(diferencas["transicoes"], args.municipio).to_string())
+    if args.saida:
+        os.makedirs(args.saida, exist_ok=True)
+        for nome in ("pecas", "transicoes"):
+            diferencas[nome].to_parquet(
+                os.path.join(args.saida, f"{nome}.parquet"), index=False
+            )
+
+
+if __name__ == "__main__":
+    main()
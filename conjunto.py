@@ -0,0 +1,312 @@
+"""Conjunto de dados do BNMP compartilhado entre as sessões do dashboard.
+
+Um único ``ConjuntoBNMP`` por processo (guardado como recurso, não como
+dado copiado): a tabela Arrow aberta por memory-map a partir do cache
+colunar, o índice dos filtros, as opções dos filtros e o cubo de
+contagens. Tudo é somente leitura. Cada sessão guarda apenas o vetor de
+posições da sua seleção e materializa em pandas só as linhas que vai
+exibir.
+
+Os resultados de cada combinação de filtros (posições e agregados das
+abas) ficam num cache LRU do conjunto, limitado por memória
+(BNMP_CACHE_RESULTADOS_MB, padrão 256).
+"""
+import hashlib
+import importlib.util
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import dados
+from cache_resultados import CacheResultados
+from cubo import CuboContagens, agregar
+from indice import SEM_VALOR, IndiceFiltros, filtros_de, opcoes_filtros
+
+# Colunas que o índice, as opções e o cubo precisam ter em pandas durante
+# a montagem
+COLUNAS_AGREGACAO = list(SEM_VALOR) + [
+    "NOM_MUNICIPIO",
+    "SEQ_PECA",
+    "TEM_ALVARA",
+    "DSC_MUNICIPIO",
+    "DSC_MOTIVO_EXPEDICAO_ALVARA",
+    "DSC_STATUS",
+]
+
+LIMITE_CACHE_RESULTADOS = int(os.environ.get("BNMP_CACHE_RESULTADOS_MB", "256")) << 20
+
+# Backend das consultas: "memoria" (este módulo), "duckdb", "sqlite" ou
+# "sql" (DuckDB se instalado, senão SQLite; ver conjunto_sql.py), ou "auto":
+# DuckDB só para CSVs acima de BNMP_AUTO_SQL_MB (padrão 2048) e só se ele
+# estiver instalado. O SQLite (carga linha a linha, sem varredura colunar)
+# nunca é escolhido sozinho
+BACKEND = os.environ.get("BNMP_BACKEND", "auto")
+LIMITE_AUTO_SQL = int(os.environ.get("BNMP_AUTO_SQL_MB", "2048")) << 20
+
+
+def _parte(calcular):
+    # Como um cached_property, mas avisa o cache de resultados que a entrada
+    # cresceu, para que o limite de memória continue valendo
+    nome = calcular.__name__
+
+    def obter(self):
+        if nome not in self.__dict__:
+            self.__dict__[nome] = calcular(self)
+            self._conjunto.resultados.remedir(self.chave)
+        return self.__dict__[nome]
+
+    return property(obter)
+
+
+# ==========================
+# Base comum dos backends
+# ==========================
+class ResultadoBase:
+    # Resultado de uma combinação de filtros. Cada parte é calculada na
+    # primeira vez que alguma aba pede e fica guardada no cache de
+    # resultados, compartilhada (somente leitura) entre as sessões. Cada
+    # backend define as partes (posicoes, n_linhas, resumo, contagens) e
+    # _ordenar; a memorização das ordenações e a conta de memória do cache
+    # são as mesmas para todos.
+    def __init__(self, conjunto, chave: str, selecoes: dict):
+        self._conjunto = conjunto
+        self.chave = chave
+        self.selecoes = {col: list(valores) for col, valores in selecoes.items()}
+        self._ordenadas = {}  # (coluna, decrescente) -> posições ordenadas
+
+    def _ordenar(self, coluna: str, decrescente: bool) -> np.ndarray:
+        raise NotImplementedError
+
+    def ordenadas(self, coluna: str, decrescente: bool = False) -> np.ndarray:
+        # Posições filtradas ordenadas por uma coluna (nulos no final; empates
+        # na ordem original), para a paginação da tabela da ABA 1
+        chave = (coluna, decrescente)
+        if chave not in self._ordenadas:
+            ordenadas = self._ordenar(coluna, decrescente)
+            if ordenadas.flags.writeable:
+                ordenadas.flags.writeable = False
+            self._ordenadas[chave] = ordenadas
+            self._conjunto.resultados.remedir(self.chave)
+        return self._ordenadas[chave]
+
+    def nbytes(self) -> int:
+        calculados = self.__dict__
+        total = sum(ordenadas.nbytes for ordenadas in self._ordenadas.values())
+        if "posicoes" in calculados:
+            total += calculados["posicoes"].nbytes
+        if "acumulados" in calculados:
+            total += sum(a.nbytes for a in calculados["acumulados"].values())
+        for nome in ("motivo_counts", "muni_counts"):
+            if nome in calculados:
+                total += int(calculados[nome].memory_usage(deep=True).sum())
+        return total
+
+
+class ConjuntoBase:
+    # Chave canônica e cache LRU dos resultados, iguais em todos os
+    # backends. Cada um define versao, dimensoes (coluna -> indice.Dimensao),
+    # resultados (CacheResultados) e Resultado (a sua classe de resultado).
+    Resultado = ResultadoBase
+
+    def chave(self, selecoes: dict) -> str:
+        # Hash canônico da seleção: usa os códigos efetivos de cada filtro
+        # (ordenados, sem repetição), então a ordem dos itens, opções
+        # inexistentes e "tudo selecionado" x "nada selecionado" não geram
+        # chaves diferentes para o mesmo resultado
+        filtros = sorted(
+            (dim.coluna, codigos.tobytes())
+            for dim, codigos in filtros_de(self.dimensoes, selecoes)
+        )
+        return hashlib.blake2b(
+            repr((self.versao, filtros)).encode(), digest_size=16
+        ).hexdigest()
+
+    def consultar(self, selecoes: dict) -> ResultadoBase:
+        chave = self.chave(selecoes)
+        return self.resultados.obter(
+            chave, lambda: self.Resultado(self, chave, selecoes)
+        )
+
+
+# ==========================
+# Backend em memória
+# ==========================
+class ResultadoFiltro(ResultadoBase):
+    # Partes calculadas sobre o índice e a tabela Arrow em memória
+    @_parte
+    def posicoes(self) -> np.ndarray:
+        posicoes = self._conjunto.indice.selecionar(self.selecoes)
+        posicoes.flags.writeable = False
+        return posicoes
+
+    @_parte
+    def n_linhas(self) -> int:
+        # Sem precisar das posições (abas que só mostram agregados)
+        if "posicoes" in self.__dict__:
+            return len(self.posicoes)
+        return self._conjunto.cubo.linhas(self.selecoes)
+
+    @_parte
+    def resumo(self) -> dict:
+        return self._conjunto.cubo.resumo(self.selecoes)
+
+    @_parte
+    def motivo_counts(self) -> pd.DataFrame:
+        return self._conjunto.cubo.contagem_por(
+            self.selecoes,
+            ["SEQ_MOTIVO_EXPEDICAO_ALVARA", "DSC_MOTIVO_EXPEDICAO_ALVARA"],
+        ).sort_values("qtd_pecas", ascending=False)
+
+    @_parte
+    def muni_counts(self) -> pd.DataFrame:
+        return self._conjunto.cubo.contagem_por(
+            self.selecoes, ["SEQ_MUNICIPIO3", "DSC_MUNICIPIO"]
+        ).sort_values("qtd_pecas", ascending=False)
+
+    @_parte
+    def acumulados(self) -> dict:
+        # Somas acumuladas na ordem das posições filtradas: o resumo dos
+        # primeiros n registros (slider da ABA 1) é a leitura do índice n - 1
+        conjunto = self._conjunto
+        posicoes = self.posicoes
+        tipo = np.int32 if len(posicoes) < np.iinfo(np.int32).max else np.int64
+        indices = pa.array(posicoes, type=pa.int64())
+
+        def coluna(col):
+            return conjunto.tabela.column(col).take(indices)
+
+        if "SEQ_PECA" in conjunto.colunas:
+            pecas = coluna("SEQ_PECA").is_valid().to_numpy(zero_copy_only=False)
+        else:
+            pecas = np.ones(len(posicoes), dtype=bool)
+        acumulados = {"pecas": np.cumsum(pecas, dtype=tipo)}
+        if "TEM_ALVARA" in conjunto.colunas:
+            com_alvara = coluna("TEM_ALVARA").to_numpy(zero_copy_only=False)
+            acumulados["com_alvara"] = np.cumsum(com_alvara, dtype=tipo)
+
+        # Distintos: marca a primeira ocorrência de cada código não nulo
+        for col, nome in (
+            ("SEQ_MUNICIPIO3", "municipios"),
+            ("SEQ_MOTIVO_EXPEDICAO_ALVARA", "motivos"),
+        ):
+            dim = conjunto.indice.dimensoes.get(col)
+            if dim is None:
+                continue
+            codigos = dim.codigos[posicoes]
+            _, primeiros = np.unique(codigos, return_index=True)
+            primeira = np.zeros(len(codigos), dtype=bool)
+            primeira[primeiros] = True
+            primeira &= codigos < len(dim.valores)
+            acumulados[nome] = np.cumsum(primeira, dtype=tipo)
+        return acumulados
+
+    def resumo_primeiros(self, n: int) -> dict:
+        # Métricas da ABA 1 para os n primeiros registros filtrados, em
+        # tempo constante depois de montados os acumulados
+        acumulados = self.acumulados
+        n = min(n, len(acumulados["pecas"]))
+        if n <= 0:
+            return {
+                "total_pecas": 0,
+                "qtd_sem_alvara": 0,
+                "qtd_com_alvara": 0,
+                "municipios_distintos": 0,
+                "motivos_distintos": 0,
+            }
+        i = n - 1
+
+        def valor(nome):
+            return int(acumulados[nome][i]) if nome in acumulados else 0
+
+        qtd_com_alvara = valor("com_alvara")
+        return {
+            "total_pecas": valor("pecas"),
+            "qtd_sem_alvara": i + 1 - qtd_com_alvara if "com_alvara" in acumulados else 0,
+            "qtd_com_alvara": qtd_com_alvara,
+            "municipios_distintos": valor("municipios"),
+            "motivos_distintos": valor("motivos"),
+        }
+
+    def _ordenar(self, coluna: str, decrescente: bool) -> np.ndarray:
+        posicoes = self.posicoes
+        valores = (
+            self._conjunto.tabela.column(coluna)
+            .take(pa.array(posicoes, type=pa.int64()))
+            .combine_chunks()
+        )
+        if pa.types.is_dictionary(valores.type):
+            valores = valores.cast(pa.string())  # ordena pelo texto
+        ordem = pc.array_sort_indices(
+            valores,
+            order="descending" if decrescente else "ascending",
+            null_placement="at_end",
+        ).to_numpy()
+        return posicoes[ordem]
+
+
+class ConjuntoBNMP(ConjuntoBase):
+    Resultado = ResultadoFiltro
+
+    def __init__(
+        self,
+        tabela: pa.Table,
+        versao: str,
+        agregados: pd.DataFrame | None = None,
+        limite_cache: int = LIMITE_CACHE_RESULTADOS,
+    ):
+        self.tabela = tabela
+        self.versao = versao
+        self.colunas = tabela.column_names
+        self.n_linhas = tabela.num_rows
+
+        # As colunas de agregação são convertidas só enquanto o índice, as
+        # opções e o cubo são montados; depois fica apenas o que eles guardam
+        base = dados.para_pandas(
+            tabela.select([col for col in COLUNAS_AGREGACAO if col in self.colunas])
+        )
+        self.indice = IndiceFiltros(base)
+        self.opcoes = opcoes_filtros(base, self.indice.dimensoes)
+
+        # Os agregados normalmente já vêm prontos da ingestão (ver dados.py)
+        if agregados is None:
+            agregados = agregar(base)
+        self.cubo = CuboContagens(agregados, self.indice)
+        self.resultados = CacheResultados(limite_cache)
+
+    @classmethod
+    def de_csv(cls, path: str) -> "ConjuntoBNMP":
+        return cls(*dados.carregar_extrato(path))
+
+    @property
+    def dimensoes(self) -> dict:
+        return self.indice.dimensoes
+
+    def linhas(self, posicoes: np.ndarray, colunas: list | None = None) -> pd.DataFrame:
+        # Copia só as linhas (e colunas) pedidas; o índice do DataFrame é a
+        # posição original da linha no extrato
+        tabela = self.tabela if colunas is None else self.tabela.select(colunas)
+        df = dados.para_pandas(tabela.take(pa.array(posicoes, type=pa.int64())))
+        df.index = pd.Index(posicoes, dtype=np.int64)
+        return df
+
+
+def abrir_conjunto(path: str, backend: str = BACKEND):
+    if os.path.isdir(path):
+        # Diretório de extratos particionados (ver particoes.py)
+        from particoes import ConjuntoParticionado
+
+        return ConjuntoParticionado.de_diretorio(path)
+
+    if backend == "auto":
+        grande = os.path.getsize(path) > LIMITE_AUTO_SQL
+        backend = "duckdb" if grande and importlib.util.find_spec("duckdb") else "memoria"
+    if backend == "memoria":
+        return ConjuntoBNMP.de_csv(path)
+
+    # Importado só aqui: o backend SQL é opcional e depende deste módulo
+    from conjunto_sql import ConjuntoSQL
+
+    return ConjuntoSQL.de_csv(path, backend)
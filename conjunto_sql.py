@@ -0,0 +1,386 @@
+"""Conjunto do BNMP servido por um banco analítico embutido.
+
+Alternativa ao ``ConjuntoBNMP`` (tabela, índice e cubo em memória) para
+extratos maiores que a memória do servidor. Os dados vão, uma vez por
+versão do CSV, do cache colunar (ver dados.py) para um arquivo de banco ao
+lado dele, e cada filtro e cada contagem das abas vira uma consulta SQL.
+Só os resultados (posições, contagens e a página exibida) ficam em memória.
+
+Usa DuckDB (varredura colunar em várias threads) quando o pacote está
+instalado e SQLite, da biblioteca padrão, caso contrário. A interface é a
+mesma do ``ConjuntoBNMP``: ``colunas``, ``opcoes``, ``consultar`` e
+``linhas``. A escolha entre os dois fica em conjunto.abrir_conjunto.
+"""
+import glob
+import os
+import sqlite3
+import tempfile
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+import dados
+from cache_resultados import CacheResultados
+from conjunto import LIMITE_CACHE_RESULTADOS, ConjuntoBase, ResultadoBase, _parte
+from indice import SEM_VALOR, Dimensao, filtros_de, opcoes_filtros
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# Falhas ao criar ou abrir o arquivo do banco (diretório somente leitura,
+# arquivo incompleto de uma versão anterior do código, etc.)
+ERROS_BANCO = (OSError, sqlite3.Error) + ((duckdb.Error,) if duckdb is not None else ())
+
+EXTENSOES = {"duckdb": "duckdb", "sqlite": "sqlite"}
+
+# Colunas de texto do extrato que voltam como categóricas, como no cache
+CATEGORICAS = ["NOM_MUNICIPIO", "DSC_MOTIVO_EXPEDICAO_ALVARA", "DSC_STATUS", "DSC_MUNICIPIO"]
+
+# Linhas por lote na carga do banco e por consulta de linhas avulsas
+TAMANHO_LOTE = 100_000
+MAXIMO_PARAMETROS = 10_000
+
+
+# ==========================
+# Arquivo do banco
+# ==========================
+def _lote_sql(tabela: pa.Table, inicio: int) -> pa.Table:
+    # Texto em vez de dicionário e a posição original da linha (LINHA)
+    colunas = [pa.array(np.arange(inicio, inicio + tabela.num_rows), type=pa.int64())]
+    for coluna in tabela.columns:
+        if pa.types.is_dictionary(coluna.type):
+            coluna = coluna.cast(pa.string())
+        colunas.append(coluna)
+    return pa.table(colunas, names=["LINHA"] + tabela.column_names)
+
+
+def _tipo_sqlite(tipo: pa.DataType) -> str:
+    if pa.types.is_integer(tipo) or pa.types.is_boolean(tipo):
+        return "INTEGER"
+    if pa.types.is_floating(tipo):
+        return "REAL"
+    return "TEXT"
+
+
+def criar_banco(tabela: pa.Table, arquivo: str, motor: str) -> None:
+    # Copia a tabela em lotes (sem materializá-la inteira) para um arquivo
+    # temporário com nome único, renomeado só no final: processos que
+    # montam o mesmo banco ao mesmo tempo não disputam o mesmo arquivo, e um
+    # banco pela metade nunca aparece com o nome final
+    temporario = f"{arquivo}.{uuid.uuid4().hex[:12]}.tmp"
+    try:
+        _copiar_tabela(tabela, temporario, motor)
+        os.replace(temporario, arquivo)
+    finally:
+        for resto in (temporario, temporario + ".wal"):
+            if os.path.exists(resto):
+                os.remove(resto)
+
+
+def _copiar_tabela(tabela: pa.Table, temporario: str, motor: str) -> None:
+    vazio = _lote_sql(tabela.slice(0, 0), 0)
+    if motor == "duckdb":
+        con = duckdb.connect(temporario)
+        con.register("lote", vazio)
+        con.execute("CREATE TABLE bnmp AS SELECT * FROM lote")
+        con.unregister("lote")
+        for inicio in range(0, tabela.num_rows, TAMANHO_LOTE):
+            con.register("lote", _lote_sql(tabela.slice(inicio, TAMANHO_LOTE), inicio))
+            con.execute("INSERT INTO bnmp SELECT * FROM lote")
+            con.unregister("lote")
+        con.close()
+    else:
+        con = sqlite3.connect(temporario)
+        definicoes = ["LINHA INTEGER PRIMARY KEY"] + [
+            f"{campo.name} {_tipo_sqlite(campo.type)}"
+            for campo in vazio.schema
+            if campo.name != "LINHA"
+        ]
+        con.execute(f"CREATE TABLE bnmp ({', '.join(definicoes)})")
+        marcadores = ", ".join("?" * vazio.num_columns)
+        for inicio in range(0, tabela.num_rows, TAMANHO_LOTE):
+            lote = _lote_sql(tabela.slice(inicio, TAMANHO_LOTE), inicio)
+            con.executemany(
+                f"INSERT INTO bnmp VALUES ({marcadores})",
+                zip(*(coluna.to_pylist() for coluna in lote.columns)),
+            )
+        # Sem varredura colunar, os filtros seletivos dependem de índices
+        for col in SEM_VALOR:
+            if col in vazio.column_names:
+                con.execute(f"CREATE INDEX idx_{col.lower()} ON bnmp ({col})")
+        con.commit()
+        con.close()
+
+
+def banco_valido(arquivo: str, motor: str) -> bool:
+    # Só confia num arquivo existente se ele tiver a tabela bnmp
+    sql = (
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = 'bnmp'"
+        if motor == "duckdb"
+        else "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'bnmp'"
+    )
+    try:
+        if motor == "duckdb":
+            con = duckdb.connect(arquivo, read_only=True)
+        else:
+            con = sqlite3.connect(f"file:{arquivo}?mode=ro", uri=True)
+        try:
+            return bool(con.execute(sql).fetchone()[0])
+        finally:
+            con.close()
+    except ERROS_BANCO:
+        return False
+
+
+class BancoSQL:
+    def __init__(self, arquivo: str, motor: str):
+        self.arquivo = arquivo
+        self.motor = motor
+        if motor == "duckdb":
+            self._con = duckdb.connect(arquivo, read_only=True)
+        self.colunas = list(self.consultar("SELECT * FROM bnmp LIMIT 0").columns)
+
+    @classmethod
+    def abrir(cls, path: str, tabela: pa.Table, versao: str, motor: str) -> "BancoSQL":
+        # Um arquivo por versão do CSV, no diretório do cache colunar; os de
+        # versões anteriores são apagados quando o novo fica pronto
+        nome = f"bnmp-{versao[:16]}.{EXTENSOES[motor]}"
+        diretorio = dados.diretorio_cache(path)
+        arquivo = os.path.join(diretorio, nome)
+        if not (os.path.exists(arquivo) and banco_valido(arquivo, motor)):
+            try:
+                criar_banco(tabela, arquivo, motor)
+            except ERROS_BANCO:
+                # Diretório somente leitura: banco temporário
+                arquivo = os.path.join(tempfile.mkdtemp(prefix="bnmp-sql-"), nome)
+                criar_banco(tabela, arquivo, motor)
+            else:
+                for antigo in glob.glob(os.path.join(diretorio, f"bnmp-*.{EXTENSOES[motor]}")):
+                    if antigo != arquivo:
+                        try:
+                            os.remove(antigo)
+                        except OSError:
+                            pass
+        return cls(arquivo, motor)
+
+    def consultar(self, sql: str, parametros: list = ()) -> pd.DataFrame:
+        # Resultado em pandas, pelo mesmo caminho Arrow do cache colunar
+        if self.motor == "duckdb":
+            # Um cursor por consulta: a conexão é compartilhada entre sessões
+            tabela = self._con.cursor().execute(sql, list(parametros)).fetch_arrow_table()
+        else:
+            con = sqlite3.connect(f"file:{self.arquivo}?mode=ro", uri=True)
+            try:
+                cursor = con.execute(sql, list(parametros))
+                nomes = [descricao[0] for descricao in cursor.description]
+                linhas = cursor.fetchall()
+            finally:
+                con.close()
+            tabela = pa.table(
+                {nome: pa.array(list(valores)) for nome, valores in zip(nomes, zip(*linhas))}
+                if linhas
+                else {nome: pa.array([], type=pa.null()) for nome in nomes}
+            )
+        return _tipar(dados.para_pandas(tabela))
+
+
+def _tipar(df: pd.DataFrame) -> pd.DataFrame:
+    # Os códigos já vêm como inteiros anuláveis; textos e a flag voltam aos
+    # tipos do cache colunar (o SQLite não tem booleano nem categoria)
+    for col in df.columns:
+        if col in CATEGORICAS:
+            df[col] = df[col].astype("category")
+        elif col == "TEM_ALVARA":
+            df[col] = df[col].fillna(False).astype(bool)
+    return df
+
+
+# ==========================
+# Resultado de uma combinação de filtros
+# ==========================
+class ResultadoSQL(ResultadoBase):
+    # Mesmas partes do conjunto.ResultadoFiltro, cada uma calculada por uma
+    # consulta na primeira vez que alguma aba pede
+    def __init__(self, conjunto: "ConjuntoSQL", chave: str, selecoes: dict):
+        super().__init__(conjunto, chave, selecoes)
+        self._onde, self._parametros = conjunto.onde(self.selecoes)
+
+    def _consultar(self, sql: str, parametros: list = ()) -> pd.DataFrame:
+        return self._conjunto.banco.consultar(sql, self._parametros + list(parametros))
+
+    @_parte
+    def posicoes(self) -> np.ndarray:
+        df = self._consultar(f"SELECT LINHA FROM bnmp WHERE {self._onde} ORDER BY LINHA")
+        posicoes = df["LINHA"].to_numpy(dtype=np.int64)
+        posicoes.flags.writeable = False
+        return posicoes
+
+    @_parte
+    def n_linhas(self) -> int:
+        if "posicoes" in self.__dict__:
+            return len(self.posicoes)
+        return int(self._consultar(f"SELECT COUNT(*) AS n FROM bnmp WHERE {self._onde}")["n"].iloc[0])
+
+    def _resumo(self, limite: int | None = None) -> dict:
+        colunas = self._conjunto.colunas
+        pecas = "COUNT(SEQ_PECA)" if "SEQ_PECA" in colunas else "COUNT(*)"
+        com_alvara = "SUM(CAST(TEM_ALVARA AS INTEGER))" if "TEM_ALVARA" in colunas else "0"
+
+        def distintos(col):
+            return f"COUNT(DISTINCT {col})" if col in colunas else "0"
+
+        origem = f"SELECT * FROM bnmp WHERE {self._onde}"
+        parametros = []
+        if limite is not None:
+            origem += " ORDER BY LINHA LIMIT ?"
+            parametros.append(int(limite))
+        linha = self._consultar(
+            f"""
+            SELECT
+                COUNT(*) AS linhas,
+                {pecas} AS pecas,
+                COALESCE({com_alvara}, 0) AS com_alvara,
+                {distintos("SEQ_MUNICIPIO3")} AS municipios,
+                {distintos("SEQ_MOTIVO_EXPEDICAO_ALVARA")} AS motivos
+            FROM ({origem}) AS filtradas
+            """,
+            parametros,
+        ).iloc[0]
+        qtd_com_alvara = int(linha["com_alvara"])
+        return {
+            "total_pecas": int(linha["pecas"]),
+            "qtd_sem_alvara": (
+                int(linha["linhas"]) - qtd_com_alvara if "TEM_ALVARA" in colunas else 0
+            ),
+            "qtd_com_alvara": qtd_com_alvara,
+            "municipios_distintos": int(linha["municipios"]),
+            "motivos_distintos": int(linha["motivos"]),
+        }
+
+    @_parte
+    def resumo(self) -> dict:
+        return self._resumo()
+
+    def resumo_primeiros(self, n: int) -> dict:
+        # Sem as somas acumuladas do backend em memória (que ocupariam uma
+        # posição por linha filtrada): o banco resume os n primeiros
+        return self._resumo(max(int(n), 0))
+
+    def _contagem_por(self, colunas: list) -> pd.DataFrame:
+        pecas = "COUNT(SEQ_PECA)" if "SEQ_PECA" in self._conjunto.colunas else "COUNT(*)"
+        grupo = ", ".join(colunas)
+        return self._consultar(
+            f"""
+            SELECT {grupo}, {pecas} AS qtd_pecas
+            FROM bnmp WHERE {self._onde}
+            GROUP BY {grupo}
+            ORDER BY qtd_pecas DESC, {colunas[0]} NULLS LAST
+            """
+        )
+
+    @_parte
+    def motivo_counts(self) -> pd.DataFrame:
+        return self._contagem_por(
+            ["SEQ_MOTIVO_EXPEDICAO_ALVARA", "DSC_MOTIVO_EXPEDICAO_ALVARA"]
+        )
+
+    @_parte
+    def muni_counts(self) -> pd.DataFrame:
+        return self._contagem_por(["SEQ_MUNICIPIO3", "DSC_MUNICIPIO"])
+
+    def _ordenar(self, coluna: str, decrescente: bool) -> np.ndarray:
+        direcao = "DESC" if decrescente else "ASC"
+        df = self._consultar(
+            f"SELECT LINHA FROM bnmp WHERE {self._onde} "
+            f"ORDER BY {coluna} {direcao} NULLS LAST, LINHA"
+        )
+        return df["LINHA"].to_numpy(dtype=np.int64)
+
+
+class ConjuntoSQL(ConjuntoBase):
+    Resultado = ResultadoSQL
+
+    def __init__(
+        self,
+        banco: BancoSQL,
+        versao: str,
+        limite_cache: int = LIMITE_CACHE_RESULTADOS,
+    ):
+        self.banco = banco
+        self.versao = versao
+        self.colunas = [col for col in banco.colunas if col != "LINHA"]
+        self.n_linhas = int(banco.consultar("SELECT COUNT(*) AS n FROM bnmp")["n"].iloc[0])
+
+        # Dimensões dos filtros montadas só sobre os valores distintos: dão
+        # as opções dos multiselects e a mesma regra de seleção do índice
+        self.dimensoes = {
+            col: Dimensao(
+                banco.consultar(f"SELECT DISTINCT {col} FROM bnmp")[col], sem_valor
+            )
+            for col, sem_valor in SEM_VALOR.items()
+            if col in self.colunas
+        }
+        pares = pd.DataFrame()
+        if "SEQ_MUNICIPIO3" in self.colunas and "NOM_MUNICIPIO" in self.colunas:
+            # Pares código/nome na ordem da primeira ocorrência no extrato
+            pares = banco.consultar(
+                """
+                SELECT SEQ_MUNICIPIO3, NOM_MUNICIPIO FROM bnmp
+                WHERE SEQ_MUNICIPIO3 IS NOT NULL AND NOM_MUNICIPIO IS NOT NULL
+                GROUP BY SEQ_MUNICIPIO3, NOM_MUNICIPIO
+                ORDER BY MIN(LINHA)
+                """
+            )
+        self.opcoes = opcoes_filtros(pares, self.dimensoes)
+        self.resultados = CacheResultados(limite_cache)
+
+    @classmethod
+    def de_csv(cls, path: str, motor: str = "sql") -> "ConjuntoSQL":
+        # motor "sql": DuckDB se estiver instalado, senão SQLite
+        if motor == "duckdb" and duckdb is None:
+            raise ImportError("BNMP_BACKEND=duckdb requer o pacote duckdb")
+        if motor != "sqlite" and duckdb is not None:
+            motor = "duckdb"
+        else:
+            motor = "sqlite"
+        tabela, versao, _ = dados.carregar_extrato(path)
+        return cls(BancoSQL.abrir(path, tabela, versao, motor), versao)
+
+    def onde(self, selecoes: dict) -> tuple[str, list]:
+        # Cláusula WHERE equivalente aos filtros linha a linha do dashboard:
+        # códigos escolhidos (IN) ou, para a opção SEM_*, os nulos
+        condicoes, parametros = [], []
+        for dim, codigos in filtros_de(self.dimensoes, selecoes):
+            valores = [dim.valores[c] for c in codigos if c < len(dim.valores)]
+            partes = []
+            if valores:
+                partes.append(f"{dim.coluna} IN ({', '.join('?' * len(valores))})")
+                parametros.extend(valores)
+            if len(codigos) > len(valores):
+                partes.append(f"{dim.coluna} IS NULL")
+            condicoes.append("(" + " OR ".join(partes) + ")" if partes else "1 = 0")
+        return " AND ".join(condicoes) or "1 = 1", parametros
+
+    def linhas(self, posicoes: np.ndarray, colunas: list | None = None) -> pd.DataFrame:
+        # Busca só as linhas pedidas, na ordem pedida; o índice do DataFrame é
+        # a posição original da linha no extrato
+        colunas = list(colunas or self.colunas)
+        lista = ", ".join(["LINHA"] + colunas)
+        partes = []
+        for inicio in range(0, len(posicoes), MAXIMO_PARAMETROS):
+            lote = [int(p) for p in posicoes[inicio:inicio + MAXIMO_PARAMETROS]]
+            partes.append(
+                self.banco.consultar(
+                    f"SELECT {lista} FROM bnmp WHERE LINHA IN ({', '.join('?' * len(lote))})",
+                    lote,
+                )
+            )
+        if not partes:
+            partes.append(self.banco.consultar(f"SELECT {lista} FROM bnmp LIMIT 0"))
+        df = pd.concat(partes).set_index("LINHA").reindex(np.asarray(posicoes, dtype=np.int64))
+        df.index.name = None
+        return _tipar(df[colunas])
@@ -0,0 +1,172 @@
+"""Cubo de contagens pré-agregado para as abas do dashboard.
+
+Todas as métricas e gráficos das abas 1 a 3 são contagens. O cubo guarda
+quantas linhas (e quantas peças com SEQ_PECA preenchido) existem para cada
+combinação de município (código e nome), motivo, status e presença de
+alvará de soltura. As descrições derivadas na carga (ver dados.derivar)
+entram como dimensões extras; como dependem dos códigos, não aumentam o
+número de células. As agregações das abas somam as células que passam nos
+filtros, então o custo de cada interação depende do número de códigos
+distintos e não do número de linhas.
+
+O cubo é montado a partir de agregados por valor original (``agregar``),
+que a ingestão calcula bloco a bloco, soma (``combinar``) e grava no cache
+junto com os dados.
+"""
+import numpy as np
+import pandas as pd
+
+from indice import IndiceFiltros
+
+# Colunas de rótulo (categóricas, derivadas na carga) agregáveis pelo cubo
+ROTULOS = ["DSC_MUNICIPIO", "DSC_MOTIVO_EXPEDICAO_ALVARA", "DSC_STATUS"]
+
+# Dimensões dos agregados, em valores originais
+DIMENSOES = [
+    "SEQ_MUNICIPIO3",
+    "DSC_MUNICIPIO",
+    "SEQ_MOTIVO_EXPEDICAO_ALVARA",
+    "DSC_MOTIVO_EXPEDICAO_ALVARA",
+    "SEQ_STATUS",
+    "DSC_STATUS",
+    "TEM_ALVARA",
+]
+
+
+# ==========================
+# Agregados por valor original
+# ==========================
+def agregar(df: pd.DataFrame) -> pd.DataFrame:
+    # Linhas e peças (SEQ_PECA preenchido; sem a coluna, todas as linhas)
+    # por combinação das dimensões presentes, mantendo os nulos
+    chaves = [col for col in DIMENSOES if col in df.columns]
+    if "SEQ_PECA" in df.columns:
+        pecas = df["SEQ_PECA"].notna().to_numpy()
+    else:
+        pecas = np.ones(len(df), dtype=bool)
+    base = df[chaves].assign(pecas=pecas)
+    return (
+        base.groupby(chaves, dropna=False, observed=True, sort=False)
+        .agg(linhas=("pecas", "size"), pecas=("pecas", "sum"))
+        .reset_index()
+    )
+
+
+def combinar(agregados: list) -> pd.DataFrame:
+    # Soma agregados parciais (ex.: um por bloco do CSV)
+    juntos = pd.concat(agregados, ignore_index=True)
+    chaves = [col for col in DIMENSOES if col in juntos.columns]
+    return (
+        juntos.groupby(chaves, dropna=False, observed=True, sort=False)[
+            ["linhas", "pecas"]
+        ]
+        .sum()
+        .reset_index()
+    )
+
+
+def top_n(contagens: pd.DataFrame, n: int, rotulo: str) -> pd.DataFrame:
+    # Primeiras `n` linhas de uma contagem já ordenada pela quantidade, mais
+    # uma linha "Outros" (código nulo) com a soma do restante. Mantém o
+    # tamanho dos dados dos gráficos fixo, qualquer que seja o número de
+    # categorias
+    if len(contagens) <= n:
+        return contagens
+    restante = contagens.iloc[n:]
+    outros = pd.DataFrame(
+        {
+            rotulo: [f"Outros ({len(restante)})"],
+            "qtd_pecas": [restante["qtd_pecas"].sum()],
+        }
+    )
+    topo = contagens.iloc[:n].astype({rotulo: object})
+    return pd.concat([topo, outros], ignore_index=True)
+
+
+class CuboContagens:
+    def __init__(self, agregados: pd.DataFrame, indice_filtros: IndiceFiltros):
+        self.indice = indice_filtros
+        self.tem_alvara = "TEM_ALVARA" in agregados.columns
+
+        # Dimensões do cubo: os códigos densos do índice dos filtros...
+        chaves = {
+            col: dim.codigos_de_valores(agregados[col])
+            for col, dim in indice_filtros.dimensoes.items()
+            if col in agregados.columns
+        }
+
+        # ... os rótulos derivados...
+        self.rotulos = {}
+        for col in ROTULOS:
+            if col in agregados.columns:
+                codigos, valores = pd.factorize(agregados[col], sort=True)
+                self.rotulos[col] = np.asarray(valores, dtype=object)
+                chaves[col] = codigos
+
+        # ... e a presença de alvará
+        if self.tem_alvara:
+            chaves["TEM_ALVARA"] = agregados["TEM_ALVARA"].to_numpy(dtype=bool)
+        else:
+            chaves["TEM_ALVARA"] = np.zeros(len(agregados), dtype=bool)
+
+        base = pd.DataFrame(chaves)
+        base["linhas"] = agregados["linhas"].to_numpy()
+        base["pecas"] = agregados["pecas"].to_numpy()
+        self.celulas = (
+            base.groupby(list(chaves), sort=True)[["linhas", "pecas"]]
+            .sum()
+            .reset_index()
+        )
+
+    def selecionadas(self, selecoes: dict) -> pd.DataFrame:
+        # Células que passam nos filtros (mesma regra do índice)
+        mascara = np.ones(len(self.celulas), dtype=bool)
+        for dim, codigos in self.indice.filtros(selecoes):
+            mascara &= dim.mascara(codigos)[self.celulas[dim.coluna].to_numpy()]
+        return self.celulas[mascara]
+
+    def _distintos(self, celulas: pd.DataFrame, col: str) -> int:
+        # Quantidade de códigos não nulos presentes (equivale ao nunique)
+        dim = self.indice.dimensoes.get(col)
+        if dim is None:
+            return 0
+        return int((np.unique(celulas[col].to_numpy()) < len(dim.valores)).sum())
+
+    def linhas(self, selecoes: dict) -> int:
+        # Quantidade de linhas que passam nos filtros
+        return int(self.selecionadas(selecoes)["linhas"].sum())
+
+    def resumo(self, selecoes: dict) -> dict:
+        # Métricas da ABA 1 para todos os registros filtrados
+        celulas = self.selecionadas(selecoes)
+        linhas = int(celulas["linhas"].sum())
+        if self.tem_alvara:
+            qtd_sem_alvara = int(celulas.loc[~celulas["TEM_ALVARA"], "linhas"].sum())
+            qtd_com_alvara = linhas - qtd_sem_alvara
+        else:
+            qtd_sem_alvara = 0
+            qtd_com_alvara = 0
+        return {
+            "total_pecas": int(celulas["pecas"].sum()),
+            "qtd_sem_alvara": qtd_sem_alvara,
+            "qtd_com_alvara": qtd_com_alvara,
+            "municipios_distintos": self._distintos(celulas, "SEQ_MUNICIPIO3"),
+            "motivos_distintos": self._distintos(celulas, "SEQ_MOTIVO_EXPEDICAO_ALVARA"),
+        }
+
+    def contagem_por(self, selecoes: dict, colunas: list) -> pd.DataFrame:
+        # Equivale a groupby(colunas, dropna=False) contando peças sobre as
+        # linhas filtradas; devolve os valores originais e "qtd_pecas"
+        celulas = self.selecionadas(selecoes)
+        contagens = (
+            celulas.groupby(colunas, sort=True)["pecas"]
+            .sum()
+            .reset_index(name="qtd_pecas")
+        )
+        for col in colunas:
+            codigos = contagens[col].to_numpy()
+            if col in self.rotulos:
+                contagens[col] = self.rotulos[col][codigos]
+            else:
+                contagens[col] = self.indice.dimensoes[col].valores_de(codigos)
+        return contagens
@@ -0,0 +1,513 @@
+"""Leitura do extrato do BNMP com cache colunar em disco.
+
+O CSV é interpretado uma única vez, em blocos de tamanho fixo
+(BNMP_TAMANHO_BLOCO linhas, padrão 500 mil): cada bloco é tipado,
+derivado, gravado como uma parte em Arrow IPC (Feather v2, sem compressão)
+e reduzido aos agregados de contagem do cubo, que são somados no final. O
+pico de memória da ingestão depende do tamanho do bloco, não do arquivo.
+
+As partes ficam num diretório ao lado do CSV, junto com um manifesto que
+guarda o tamanho, a data de modificação e o hash do conteúdo do arquivo de
+origem. Nas partidas seguintes o cache é aberto por memory-map, sem
+tokenizar o texto de novo.
+
+Quando o extrato novo é o anterior com linhas acrescentadas no final (o
+hash dos primeiros bytes bate com o do manifesto), só a cauda é
+interpretada: vira partes novas da mesma geração e seus agregados são
+somados aos gravados. Qualquer outra mudança refaz o cache inteiro.
+
+O manifesto também guarda o relatório de qualidade do extrato (ver
+qualidade.py), calculado na mesma ingestão.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+import qualidade
+from cubo import agregar, combinar
+from tabelas import MOTIVO_MAP, NAO_INFORMADO, SEM_NOME_MUNICIPIO, STATUS_MAP
+
+# Incrementar sempre que mudar a forma como o CSV é tipado/derivado,
+# para que caches antigos sejam descartados.
+VERSAO_CACHE = 5
+
+ARQUIVO_AGREGADOS = "agregados.arrow"
+ARQUIVO_MANIFESTO = "manifesto.json"
+TAMANHO_BLOCO_HASH = 1 << 20  # 1 MiB por leitura ao calcular o hash
+TAMANHO_BLOCO = int(os.environ.get("BNMP_TAMANHO_BLOCO", "500000"))
+
+# Inteiros do Arrow voltam para pandas como inteiros anuláveis, mesmo que
+# alguma parte tenha sido promovida para um tipo mais largo
+TIPOS_PANDAS = {
+    pa.int8(): pd.Int8Dtype(),
+    pa.int16(): pd.Int16Dtype(),
+    pa.int32(): pd.Int32Dtype(),
+    pa.int64(): pd.Int64Dtype(),
+}
+
+# ==========================
+# Esquema do extrato BNMP
+# ==========================
+# Somente as colunas usadas pelo dashboard são lidas do CSV. Os códigos
+# viram inteiros anuláveis pequenos e os textos repetitivos viram
+# "category", o que reduz bastante o DataFrame residente em cada worker.
+ESQUEMA_BNMP = {
+    "SEQ_PECA": "Int64",
+    "SEQ_MUNICIPIO3": "Int32",
+    "NOM_MUNICIPIO": "category",
+    "SEQ_MOTIVO_EXPEDICAO_ALVARA": "Int16",
+    "SEQ_STATUS": "Int16",
+    "SEQ_ALVARA_SOLTURA": "Int64",
+}
+
+
+# ==========================
+# Impressão digital do CSV
+# ==========================
+def diretorio_cache(path: str) -> str:
+    # BNMP_MORADOR_RUA.CSV -> BNMP_MORADOR_RUA.cache/
+    base, _ = os.path.splitext(path)
+    return base + ".cache"
+
+
+def hash_arquivo(path: str, tamanho_prefixo: int = 0) -> tuple[str, str | None]:
+    # Hash do conteúdo inteiro do arquivo e, na mesma leitura, dos primeiros
+    # `tamanho_prefixo` bytes (None se o arquivo for menor que isso)
+    h = hashlib.blake2b(digest_size=16)
+    prefixo = h.hexdigest() if tamanho_prefixo == 0 else None
+    lidos = 0
+    with open(path, "rb") as f:
+        while True:
+            tamanho = TAMANHO_BLOCO_HASH
+            if prefixo is None:
+                tamanho = min(tamanho, tamanho_prefixo - lidos)
+            bloco = f.read(tamanho)
+            if not bloco:
+                break
+            h.update(bloco)
+            lidos += len(bloco)
+            if prefixo is None and lidos == tamanho_prefixo:
+                prefixo = h.hexdigest()
+    return h.hexdigest(), prefixo
+
+
+def estado_arquivo(path: str) -> tuple:
+    # Verificação barata (um stat) para saber se o CSV mudou entre reruns
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def arquivos_particoes(diretorio: str) -> list:
+    # CSVs de um diretório particionado (em qualquer nível, ex.:
+    # UF=SP/ANO=2024/extrato.csv), em ordem de caminho
+    return sorted(
+        os.path.join(raiz, nome)
+        for raiz, _, nomes in os.walk(diretorio)
+        for nome in nomes
+        if nome.lower().endswith(".csv")
+    )
+
+
+def estado_dados(path: str) -> tuple:
+    # Como estado_arquivo, para um CSV ou um diretório de partições
+    if os.path.isdir(path):
+        return tuple(
+            (os.path.relpath(arquivo, path),) + estado_arquivo(arquivo)
+            for arquivo in arquivos_particoes(path)
+        )
+    return estado_arquivo(path)
+
+
+def impressao_digital(path: str, manifesto: dict | None = None) -> tuple[dict, str | None]:
+    # Devolve tamanho, data e hash do CSV e, se ele cresceu desde o
+    # manifesto, o hash dos seus primeiros bytes até o tamanho anterior (se
+    # bater com o hash anterior, o extrato novo só ganhou linhas no final)
+    stat = os.stat(path)
+    digital = {"tamanho": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    # Se tamanho e data de modificação batem com o manifesto, reaproveita o
+    # hash já calculado; só relê o arquivo inteiro quando algo mudou.
+    anterior = (manifesto or {}).get("csv", {})
+    if (
+        anterior.get("tamanho") == digital["tamanho"]
+        and anterior.get("mtime_ns") == digital["mtime_ns"]
+    ):
+        digital["hash"] = anterior["hash"]
+        return digital, None
+
+    tamanho_anterior = anterior.get("tamanho") or 0
+    if 0 < tamanho_anterior < digital["tamanho"]:
+        digital["hash"], hash_prefixo = hash_arquivo(path, tamanho_anterior)
+        return digital, hash_prefixo
+    digital["hash"], _ = hash_arquivo(path)
+    return digital, None
+
+
+# ==========================
+# Manifesto e cache em disco
+# ==========================
+def ler_manifesto(diretorio: str) -> dict | None:
+    try:
+        with open(os.path.join(diretorio, ARQUIVO_MANIFESTO), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def gravar_manifesto(diretorio: str, manifesto: dict) -> None:
+    destino = os.path.join(diretorio, ARQUIVO_MANIFESTO)
+    temporario = f"{destino}.{uuid.uuid4().hex[:12]}.tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=2)
+    os.replace(temporario, destino)
+
+
+def cache_valido(manifesto: dict | None, digital: dict) -> bool:
+    return (
+        manifesto is not None
+        and manifesto.get("versao") == VERSAO_CACHE
+        and manifesto.get("csv", {}).get("tamanho") == digital["tamanho"]
+        and manifesto.get("csv", {}).get("hash") == digital["hash"]
+    )
+
+
+def para_arrow(df: pd.DataFrame) -> pa.Table:
+    # Sem o metadado do pandas e com dicionários de índice int32, para que
+    # partes de blocos diferentes tenham o mesmo esquema e possam ser
+    # concatenadas
+    tabela = pa.Table.from_pandas(df, preserve_index=False).replace_schema_metadata(None)
+    for i, campo in enumerate(tabela.schema):
+        if pa.types.is_dictionary(campo.type):
+            tabela = tabela.set_column(
+                i, campo.name, tabela.column(i).cast(pa.dictionary(pa.int32(), pa.string()))
+            )
+    return tabela
+
+
+def para_pandas(tabela: pa.Table) -> pd.DataFrame:
+    return tabela.to_pandas(types_mapper=TIPOS_PANDAS.get)
+
+
+def gravar_arrow(tabela: pa.Table, destino: str) -> None:
+    # Grava primeiro num arquivo temporário: um leitor concorrente nunca vê
+    # um arquivo pela metade
+    temporario = destino + ".tmp"
+    feather.write_feather(tabela, temporario, compression="uncompressed")
+    os.replace(temporario, destino)
+
+
+def abrir_cache(diretorio: str, manifesto: dict) -> tuple[pa.Table, pd.DataFrame]:
+    # Memory-map: as colunas apontam direto para as páginas dos arquivos,
+    # que o sistema operacional compartilha entre todos os processos que os
+    # abrem. As partes são só encadeadas, sem cópia.
+    geracao = os.path.join(diretorio, manifesto["geracao"])
+    partes = [
+        feather.read_table(os.path.join(geracao, parte), memory_map=True)
+        for parte in manifesto["partes"]
+    ]
+    tabela = pa.concat_tables(partes, promote_options="permissive")
+    agregados = para_pandas(
+        feather.read_table(os.path.join(geracao, ARQUIVO_AGREGADOS))
+    )
+    return tabela, agregados
+
+
+def limpar_geracoes(diretorio: str, atual: str) -> None:
+    # Remove as gerações antigas do cache. Quem ainda as tem abertas por
+    # memory-map continua lendo normalmente até fechar.
+    for nome in os.listdir(diretorio):
+        if nome.startswith("geracao-") and nome != atual:
+            shutil.rmtree(os.path.join(diretorio, nome), ignore_errors=True)
+
+
+# ==========================
+# Leitura do CSV
+# ==========================
+def converter_codigo(serie: pd.Series, tipo: str) -> pd.Series:
+    # Garante que os códigos sejam numéricos (quando possível); valores
+    # malformados viram nulo, inclusive números não inteiros (ex.: "1.5") e
+    # fora do Int64, que não têm conversão exata. Se algum código não couber
+    # no tipo declarado, cai para Int64 em vez de estourar.
+    numerico = pd.to_numeric(serie, errors="coerce")
+    if pd.api.types.is_float_dtype(numerico):
+        numerico = numerico.where(
+            (numerico % 1 == 0) & (numerico >= -(2**63)) & (numerico < 2**63)
+        )
+    limites = np.iinfo(pd.api.types.pandas_dtype(tipo).numpy_dtype)
+    if numerico.min() < limites.min or numerico.max() > limites.max:
+        tipo = "Int64"
+    return numerico.astype(tipo)
+
+
+def tipar(df: pd.DataFrame, falhas: dict | None = None) -> pd.DataFrame:
+    # `falhas` (coluna -> linhas), quando passado, acumula os valores que
+    # não viraram número (ver qualidade.py)
+    for col, tipo in ESQUEMA_BNMP.items():
+        if col not in df.columns:
+            continue
+        if tipo == "category":
+            df[col] = df[col].astype("category")
+        else:
+            convertido = converter_codigo(df[col], tipo)
+            if falhas is not None:
+                qualidade.contar_falhas(falhas, col, df[col], convertido)
+            df[col] = convertido
+    return df
+
+
+# ==========================
+# Colunas derivadas
+# ==========================
+def rotular(serie: pd.Series, rotulo_de, rotulo_nulo: str) -> pd.Categorical:
+    # Aplica rotulo_de() só aos valores distintos e monta o categórico a
+    # partir dos códigos, sem converter a coluna inteira para texto
+    codigos, valores = pd.factorize(serie)
+    rotulos = [rotulo_de(v) for v in valores.tolist()] + [rotulo_nulo]
+    categorias = list(dict.fromkeys(rotulos))
+    posicao = {rotulo: i for i, rotulo in enumerate(categorias)}
+    lut = np.array([posicao[r] for r in rotulos], dtype=np.int32)
+    # nulos têm código -1 no factorize, que cai no último item da lut
+    return pd.Categorical.from_codes(lut[codigos], categories=categorias)
+
+
+def derivar(df: pd.DataFrame) -> pd.DataFrame:
+    # Calculadas uma vez na carga e gravadas no cache; o dashboard só lê
+    if "SEQ_MOTIVO_EXPEDICAO_ALVARA" in df.columns:
+        df["DSC_MOTIVO_EXPEDICAO_ALVARA"] = rotular(
+            df["SEQ_MOTIVO_EXPEDICAO_ALVARA"],
+            lambda cod: MOTIVO_MAP.get(cod, NAO_INFORMADO),
+            NAO_INFORMADO,
+        )
+    if "SEQ_STATUS" in df.columns:
+        df["DSC_STATUS"] = rotular(
+            df["SEQ_STATUS"],
+            lambda cod: STATUS_MAP.get(cod, NAO_INFORMADO),
+            NAO_INFORMADO,
+        )
+    if "SEQ_ALVARA_SOLTURA" in df.columns:
+        df["TEM_ALVARA"] = df["SEQ_ALVARA_SOLTURA"].notna()
+    if "NOM_MUNICIPIO" in df.columns:
+        df["DSC_MUNICIPIO"] = rotular(
+            df["NOM_MUNICIPIO"],
+            lambda nome: str(nome).strip() or SEM_NOME_MUNICIPIO,
+            SEM_NOME_MUNICIPIO,
+        )
+    return df
+
+
+def _read_csv(path: str, **kwargs):
+    return pd.read_csv(
+        path,
+        sep=";",
+        usecols=lambda col: col in ESQUEMA_BNMP,
+        dtype={col: tipo for col, tipo in ESQUEMA_BNMP.items() if tipo == "category"},
+        # Sem os sub-blocos internos do parser: um sub-bloco só com nomes
+        # vazios gera categorias de outro tipo e o pandas não consegue
+        # juntá-las. A memória já é limitada pelo tamanho do bloco.
+        low_memory=False,
+        **kwargs,
+    )
+
+
+def ler_csv(path: str) -> pd.DataFrame:
+    return derivar(tipar(_read_csv(path)))
+
+
+def ler_csv_em_blocos(path: str, tamanho_bloco: int = TAMANHO_BLOCO, falhas: dict | None = None):
+    # Mesma leitura de ler_csv, devolvendo um DataFrame tipado e derivado
+    # por bloco de até `tamanho_bloco` linhas
+    with _read_csv(path, chunksize=tamanho_bloco) as leitor:
+        for bloco in leitor:
+            yield derivar(tipar(bloco, falhas))
+
+
+# ==========================
+# Ingestão em blocos
+# ==========================
+def ingerir_em_blocos(
+    path: str, diretorio: str, digital: dict, tamanho_bloco: int = TAMANHO_BLOCO
+) -> dict:
+    # Cada ingestão grava numa geração nova; o manifesto só passa a apontar
+    # para ela no final, então leitores nunca veem uma ingestão pela metade
+    geracao = "geracao-" + uuid.uuid4().hex[:12]
+    destino = os.path.join(diretorio, geracao)
+    os.makedirs(destino)
+
+    partes, agregados, linhas, colunas, falhas = [], [], 0, [], {}
+    for bloco in ler_csv_em_blocos(path, tamanho_bloco, falhas):
+        if partes and bloco.empty:
+            continue
+        parte = f"parte-{len(partes):05d}.arrow"
+        gravar_arrow(para_arrow(bloco), os.path.join(destino, parte))
+        partes.append(parte)
+        agregados.append(agregar(bloco))
+        linhas += len(bloco)
+        colunas = list(bloco.columns)
+
+    if not partes:
+        # CSV só com o cabeçalho: grava uma parte vazia com as colunas
+        bloco = ler_csv(path)
+        gravar_arrow(para_arrow(bloco), os.path.join(destino, "parte-00000.arrow"))
+        partes.append("parte-00000.arrow")
+        agregados.append(agregar(bloco))
+        colunas = list(bloco.columns)
+
+    gravar_arrow(
+        para_arrow(combinar(agregados)), os.path.join(destino, ARQUIVO_AGREGADOS)
+    )
+    manifesto = {
+        "versao": VERSAO_CACHE,
+        "csv": digital,
+        "geracao": geracao,
+        "partes": partes,
+        "linhas": linhas,
+        "colunas": colunas,
+    }
+    tabela, agregados = abrir_cache(diretorio, manifesto)
+    manifesto["qualidade"] = qualidade.avaliar(tabela, agregados, falhas)
+    gravar_manifesto(diretorio, manifesto)
+    limpar_geracoes(diretorio, geracao)
+    return manifesto
+
+
+# ==========================
+# Anexação incremental
+# ==========================
+def so_cresceu(path: str, manifesto: dict | None, hash_prefixo: str | None) -> bool:
+    # O CSV atual é o anterior mais linhas no final: mesmo hash até o tamanho
+    # antigo, e o arquivo antigo terminava numa quebra de linha
+    if (
+        manifesto is None
+        or manifesto.get("versao") != VERSAO_CACHE
+        or hash_prefixo is None
+        or hash_prefixo != manifesto["csv"]["hash"]
+    ):
+        return False
+    with open(path, "rb") as f:
+        f.seek(manifesto["csv"]["tamanho"] - 1)
+        return f.read(1) == b"\n"
+
+
+def _vincular(origem: str, destino: str) -> None:
+    # Hard link (sem copiar os dados); cópia se o sistema de arquivos não
+    # suportar
+    try:
+        os.link(origem, destino)
+    except OSError:
+        shutil.copyfile(origem, destino)
+
+
+def anexar_cauda(
+    path: str,
+    diretorio: str,
+    manifesto: dict,
+    digital: dict,
+    tamanho_bloco: int = TAMANHO_BLOCO,
+) -> dict:
+    # Interpreta só os bytes novos do CSV e monta uma geração nova com as
+    # partes atuais (por hard link), as da cauda e os agregados somados.
+    # Como em ingerir_em_blocos, o manifesto só passa a apontar para ela no
+    # final: a geração atual nunca é alterada
+    anterior = os.path.join(diretorio, manifesto["geracao"])
+    geracao = "geracao-" + uuid.uuid4().hex[:12]
+    destino = os.path.join(diretorio, geracao)
+    os.makedirs(destino)
+    cabecalho = list(pd.read_csv(path, sep=";", nrows=0).columns)
+
+    partes = list(manifesto["partes"])
+    for parte in partes:
+        _vincular(os.path.join(anterior, parte), os.path.join(destino, parte))
+    agregados = [
+        para_pandas(feather.read_table(os.path.join(anterior, ARQUIVO_AGREGADOS)))
+    ]
+    linhas = manifesto["linhas"]
+    falhas = dict(manifesto.get("qualidade", {}).get("falhas_conversao", {}))
+    with open(path, "rb") as f:
+        f.seek(manifesto["csv"]["tamanho"])
+        with _read_csv(f, header=None, names=cabecalho, chunksize=tamanho_bloco) as leitor:
+            for bloco in leitor:
+                bloco = derivar(tipar(bloco, falhas))
+                parte = f"parte-{len(partes):05d}.arrow"
+                gravar_arrow(para_arrow(bloco), os.path.join(destino, parte))
+                partes.append(parte)
+                agregados.append(agregar(bloco))
+                linhas += len(bloco)
+
+    gravar_arrow(
+        para_arrow(combinar(agregados)), os.path.join(destino, ARQUIVO_AGREGADOS)
+    )
+    manifesto = dict(manifesto, csv=digital, geracao=geracao, partes=partes, linhas=linhas)
+    # Repetidos e conflitos podem envolver linhas antigas: refeitos sobre o
+    # extrato inteiro (a cauda só soma falhas de conversão)
+    tabela, agregados = abrir_cache(diretorio, manifesto)
+    manifesto["qualidade"] = qualidade.avaliar(tabela, agregados, falhas)
+    gravar_manifesto(diretorio, manifesto)
+    limpar_geracoes(diretorio, geracao)
+    return manifesto
+
+
+def carregar_extrato(path: str) -> tuple[pa.Table, str, pd.DataFrame]:
+    # Devolve a tabela Arrow do extrato (memory-mapped a partir do cache), a
+    # versão dos dados (hash do conteúdo do CSV) e os agregados do cubo
+    diretorio = diretorio_cache(path)
+    manifesto = ler_manifesto(diretorio)
+    digital, hash_prefixo = impressao_digital(path, manifesto)
+
+    if cache_valido(manifesto, digital):
+        try:
+            tabela, agregados = abrir_cache(diretorio, manifesto)
+        except (OSError, KeyError, pa.ArrowException):
+            pass  # cache incompleto ou corrompido: refaz a partir do CSV
+        else:
+            if manifesto["csv"]["mtime_ns"] != digital["mtime_ns"]:
+                # Mesmo conteúdo com outra data (ex.: arquivo copiado de novo)
+                manifesto["csv"] = digital
+                try:
+                    gravar_manifesto(diretorio, manifesto)
+                except OSError:
+                    pass
+            return tabela, digital["hash"], agregados
+
+    if so_cresceu(path, manifesto, hash_prefixo):
+        # Extrato diário = o de ontem + peças novas: só a cauda é lida
+        try:
+            manifesto = anexar_cauda(path, diretorio, manifesto, digital)
+            tabela, agregados = abrir_cache(diretorio, manifesto)
+            return tabela, digital["hash"], agregados
+        except (OSError, KeyError, pa.ArrowException):
+            pass  # não deu para anexar: refaz tudo
+
+    try:
+        os.makedirs(diretorio, exist_ok=True)
+        manifesto = ingerir_em_blocos(path, diretorio, digital)
+    except OSError:
+        # Diretório do CSV somente leitura: usa um cache temporário
+        diretorio = tempfile.mkdtemp(prefix="bnmp-cache-")
+        manifesto = ingerir_em_blocos(path, diretorio, digital)
+    tabela, agregados = abrir_cache(diretorio, manifesto)
+    return tabela, digital["hash"], agregados
+
+
+def qualidade_dados(path: str) -> dict:
+    # Relatórios de qualidade gravados nos manifestos: arquivo -> relatório
+    # (None se o cache ainda não existe ou é de uma versão anterior)
+    paths = arquivos_particoes(path) if os.path.isdir(path) else [path]
+    relatorios = {}
+    for arquivo in paths:
+        manifesto = ler_manifesto(diretorio_cache(arquivo)) or {}
+        nome = os.path.relpath(arquivo, path) if os.path.isdir(path) else os.path.basename(arquivo)
+        relatorios[nome] = manifesto.get("qualidade")
+    return relatorios
+
+
+def carregar_bnmp(path: str) -> pd.DataFrame:
+    tabela, _, _ = carregar_extrato(path)
+    return para_pandas(tabela)
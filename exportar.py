@@ -0,0 +1,102 @@
+"""Exportação do resultado filtrado e das contagens das abas.
+
+Os registros são lidos e codificados em lotes (BNMP_LOTE_EXPORTACAO
+linhas, padrão 100 mil): cada lote vem de conjunto.linhas só com as suas
+posições e é escrito no destino antes do próximo ser lido. Exportar uma
+seleção grande nunca monta o DataFrame filtrado inteiro em memória nem
+passa pela tabela da tela.
+
+Formatos: CSV separado por ";" (como o extrato de origem) ou Parquet.
+"""
+import io
+import os
+import tempfile
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# formato -> (tipo MIME, extensão do arquivo)
+FORMATOS = {
+    "csv": ("text/csv", ".csv"),
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+}
+
+LINHAS_POR_LOTE = int(os.environ.get("BNMP_LOTE_EXPORTACAO", "100000"))
+
+
+def lotes(conjunto, posicoes: np.ndarray, colunas: list | None = None, tamanho: int = LINHAS_POR_LOTE):
+    # DataFrames de até `tamanho` linhas, na ordem de `posicoes`. Sempre há
+    # ao menos um lote (vazio quando não há posições), para o cabeçalho
+    for inicio in range(0, max(len(posicoes), 1), tamanho):
+        yield conjunto.linhas(posicoes[inicio : inicio + tamanho], colunas)
+
+
+def _sem_dicionarios(esquema: pa.Schema) -> pa.Schema:
+    # Colunas "category" viram texto simples: o tipo do índice do
+    # dicionário muda de um lote para outro (e entre partições), o do
+    # arquivo não pode mudar. O Parquet refaz a codificação por dicionário.
+    return pa.schema(
+        [
+            campo.with_type(campo.type.value_type)
+            if pa.types.is_dictionary(campo.type)
+            else campo
+            for campo in esquema
+        ]
+    )
+
+
+def gravar(dfs, destino, formato: str) -> None:
+    # Escreve os DataFrames de `dfs` (em sequência, um arquivo só) no
+    # arquivo binário `destino`, um de cada vez
+    if formato == "csv":
+        cabecalho = True
+        for df in dfs:
+            destino.write(df.to_csv(sep=";", index=False, header=cabecalho).encode("utf-8"))
+            cabecalho = False
+    elif formato == "parquet":
+        escritor = None
+        try:
+            for df in dfs:
+                tabela = pa.Table.from_pandas(df, preserve_index=False)
+                if escritor is None:
+                    esquema = _sem_dicionarios(tabela.schema)
+                    escritor = pq.ParquetWriter(destino, esquema)
+                escritor.write_table(tabela.cast(esquema))
+        finally:
+            if escritor is not None:
+                escritor.close()
+    else:
+        raise ValueError(f"Formato de exportação desconhecido: {formato}")
+
+
+class ArquivoExportado(io.BufferedReader):
+    # Arquivo temporário já gravado, aberto para leitura (o download_button
+    # aceita BufferedReader). É apagado ao ser fechado, e o Streamlit lê o
+    # arquivo inteiro de uma vez com read(), que já o fecha
+    def read(self, tamanho: int | None = -1) -> bytes:
+        conteudo = super().read(tamanho)
+        if tamanho is None or tamanho < 0:
+            self.close()
+        return conteudo
+
+    def close(self) -> None:
+        if not self.closed:
+            super().close()
+            try:
+                os.remove(self.name)
+            except OSError:
+                pass
+
+
+def arquivo_temporario(dfs, formato: str) -> ArquivoExportado:
+    # Grava num arquivo temporário em disco e o devolve aberto para leitura,
+    # posicionado no início
+    descritor, caminho = tempfile.mkstemp(prefix="bnmp-", suffix=FORMATOS.get(formato, ("", ""))[1])
+    try:
+        with os.fdopen(descritor, "wb") as destino:
+            gravar(dfs, destino, formato)
+    except BaseException:
+        os.remove(caminho)
+        raise
+    return ArquivoExportado(io.FileIO(caminho, "rb"))
@@ -0,0 +1,71 @@
+"""Gráficos de barras das abas 1 a 3 (Altair).
+
+Usados pelo dashboard e pelos relatórios em lote (relatorios.py), para que
+os dois mostrem exatamente os mesmos gráficos.
+"""
+import os
+
+import altair as alt
+import pandas as pd
+
+from cubo import top_n
+
+# Barras dos gráficos das abas 2 e 3 antes da barra "Outros"
+TOP_GRAFICOS = int(os.environ.get("BNMP_TOP_GRAFICOS", "20"))
+
+
+def barras_resumo(resumo_df: pd.DataFrame) -> alt.Chart:
+    # ABA 1: dados de nucleo.grafico_resumo
+    return (
+        alt.Chart(resumo_df)
+        .mark_bar()
+        .encode(
+            x=alt.X("Categoria:N", sort=None, title="Categoria"),
+            y=alt.Y("Quantidade:Q", title="Quantidade"),
+            tooltip=["Categoria", "Quantidade"],
+        )
+    )
+
+
+def barras_motivos(motivo_counts: pd.DataFrame, top: int) -> alt.Chart:
+    # ABA 2: só os `top` motivos com mais peças e uma barra "Outros"
+    return (
+        alt.Chart(top_n(motivo_counts, top, "DSC_MOTIVO_EXPEDICAO_ALVARA"))
+        .mark_bar()
+        .encode(
+            x=alt.X(
+                "DSC_MOTIVO_EXPEDICAO_ALVARA:N",
+                sort=None,  # ordem da contagem, "Outros" no fim
+                title="Motivo de expedição do alvará",
+            ),
+            y=alt.Y("qtd_pecas:Q", title="Quantidade de peças"),
+            tooltip=[
+                alt.Tooltip("SEQ_MOTIVO_EXPEDICAO_ALVARA:Q", title="Código do motivo"),
+                alt.Tooltip("DSC_MOTIVO_EXPEDICAO_ALVARA:N", title="Motivo"),
+                alt.Tooltip("qtd_pecas:Q", title="Quantidade de peças"),
+            ],
+        )
+        .properties(height=500)
+    )
+
+
+def barras_municipios(muni_counts: pd.DataFrame, top: int) -> alt.Chart:
+    # ABA 3: só os `top` municípios com mais peças e uma barra "Outros"
+    return (
+        alt.Chart(top_n(muni_counts, top, "DSC_MUNICIPIO"))
+        .mark_bar()
+        .encode(
+            x=alt.X(
+                "DSC_MUNICIPIO:N",
+                sort=None,  # ordem da contagem, "Outros" no fim
+                title="Município",
+            ),
+            y=alt.Y("qtd_pecas:Q", title="Quantidade de peças"),
+            tooltip=[
+                alt.Tooltip("SEQ_MUNICIPIO3:Q", title="Código do Município"),
+                alt.Tooltip("DSC_MUNICIPIO:N", title="Município"),
+                alt.Tooltip("qtd_pecas:Q", title="Quantidade de peças"),
+            ],
+        )
+        .properties(height=500)
+    )
@@ -0,0 +1,190 @@
+"""Índice invertido das colunas usadas nos filtros da barra lateral.
+
+Para cada coluna filtrável (município, motivo e status) o índice guarda,
+uma única vez por carga dos dados, o código denso de cada linha e as
+posições das linhas agrupadas por código (no estilo CSR). Aplicar uma
+combinação de filtros vira: juntar as posições dos valores escolhidos na
+dimensão mais seletiva (OU) e descartar, por tabela de consulta, as que não
+passam nas demais (E). O resultado é um vetor de posições pronto para um
+único ``take``.
+
+As opções e os rótulos dos multiselects saem das mesmas dimensões
+(``OpcoesFiltro``), então também são calculados uma vez por versão dos
+dados.
+"""
+import numpy as np
+import pandas as pd
+
+from tabelas import MOTIVO_MAP, NAO_INFORMADO, STATUS_MAP
+
+# Opção do multiselect que representa os registros sem código
+SEM_VALOR = {
+    "SEQ_MUNICIPIO3": "SEM_MUNICIPIO",
+    "SEQ_MOTIVO_EXPEDICAO_ALVARA": "SEM_MOTIVO",
+    "SEQ_STATUS": "SEM_STATUS",
+}
+
+# Rótulo exibido para a opção SEM_* no multiselect
+ROTULO_SEM_VALOR = {
+    "SEQ_MUNICIPIO3": "SEM MUNICÍPIO INFORMADO",
+    "SEQ_MOTIVO_EXPEDICAO_ALVARA": "SEM MOTIVO INFORMADO",
+    "SEQ_STATUS": "SEM STATUS INFORMADO",
+}
+
+
+class Dimensao:
+    def __init__(self, serie: pd.Series, sem_valor: str):
+        self.coluna = serie.name
+        self.dtype = serie.dtype
+        codigos, valores = pd.factorize(serie, sort=True)
+
+        # Os nulos (-1 no factorize) ganham o último código denso
+        self.valores = valores.tolist()
+        self.sem_valor = sem_valor
+        nulo = len(self.valores)
+        codigos = codigos.astype(np.int32)
+        codigos[codigos < 0] = nulo
+        self.codigos = codigos
+
+        contagens = np.bincount(codigos, minlength=nulo + 1)
+        self.tem_nulo = bool(contagens[nulo])
+        self.n_codigos = nulo + 1 if self.tem_nulo else nulo
+
+        # Posições das linhas agrupadas por código, em ordem crescente dentro
+        # de cada grupo: as linhas do código c ficam em
+        # ordem[inicios[c]:inicios[c + 1]]
+        self.ordem = np.argsort(codigos, kind="stable")
+        if len(codigos) < np.iinfo(np.int32).max:
+            self.ordem = self.ordem.astype(np.int32)  # metade da memória
+        self.inicios = np.concatenate(([0], np.cumsum(contagens)))
+
+        self.codigo_de = {valor: i for i, valor in enumerate(self.valores)}
+        if self.tem_nulo:
+            self.codigo_de[sem_valor] = nulo
+
+    def codigos_de_valores(self, serie: pd.Series) -> np.ndarray:
+        # Valor original -> código denso (nulos no código dos sem valor)
+        codigos = pd.Index(self.valores).get_indexer(serie).astype(np.int32)
+        codigos[codigos < 0] = len(self.valores)
+        return codigos
+
+    def codigos_selecionados(self, selecionados) -> np.ndarray:
+        # Valores ausentes dos dados são ignorados, como no isin
+        return np.array(
+            sorted({self.codigo_de[v] for v in selecionados if v in self.codigo_de}),
+            dtype=np.int32,
+        )
+
+    def contagem(self, codigos: np.ndarray) -> int:
+        return int((self.inicios[codigos + 1] - self.inicios[codigos]).sum())
+
+    def posicoes(self, codigos: np.ndarray) -> np.ndarray:
+        if len(codigos) == 0:
+            return np.empty(0, dtype=self.ordem.dtype)
+        return np.concatenate(
+            [self.ordem[self.inicios[c]:self.inicios[c + 1]] for c in codigos]
+        )
+
+    def valores_de(self, codigos: np.ndarray) -> pd.api.extensions.ExtensionArray:
+        # Código denso -> valor original (nulo para o código dos sem valor)
+        return pd.array(self.valores + [None], dtype=self.dtype).take(codigos)
+
+    def mascara(self, codigos: np.ndarray) -> np.ndarray:
+        # Tabela de consulta código -> selecionado
+        lut = np.zeros(len(self.inicios) - 1, dtype=bool)
+        lut[codigos] = True
+        return lut
+
+
+def filtros_de(dimensoes: dict, selecoes: dict) -> list:
+    # selecoes: coluna -> lista de opções escolhidas no multiselect.
+    # Lista vazia (ou coluna ausente) significa "sem filtro".
+    # Devolve [(dimensao, codigos selecionados)] só das que restringem.
+    filtros = []
+    for col, selecionados in selecoes.items():
+        dim = dimensoes.get(col)
+        if dim is None or not selecionados:
+            continue
+        codigos = dim.codigos_selecionados(selecionados)
+        if len(codigos) == dim.n_codigos:
+            continue  # tudo selecionado: não restringe nada
+        filtros.append((dim, codigos))
+    return filtros
+
+
+class IndiceFiltros:
+    def __init__(self, df: pd.DataFrame):
+        self.n_linhas = len(df)
+        self.dimensoes = {
+            col: Dimensao(df[col], sem_valor)
+            for col, sem_valor in SEM_VALOR.items()
+            if col in df.columns
+        }
+
+    def filtros(self, selecoes: dict) -> list:
+        return filtros_de(self.dimensoes, selecoes)
+
+    def selecionar(self, selecoes: dict) -> np.ndarray:
+        filtros = self.filtros(selecoes)
+        if not filtros:
+            return np.arange(self.n_linhas)
+
+        # Parte da dimensão que devolve menos linhas e só consulta as demais
+        # nas posições que sobraram
+        filtros.sort(key=lambda f: f[0].contagem(f[1]))
+        dim, codigos = filtros[0]
+        posicoes = dim.posicoes(codigos)
+        for dim, codigos in filtros[1:]:
+            posicoes = posicoes[dim.mascara(codigos)[dim.codigos[posicoes]]]
+
+        # Mantém a ordem original das linhas
+        posicoes.sort()
+        return posicoes
+
+
+# ==========================
+# Opções dos filtros da barra lateral
+# ==========================
+def dicionario_municipios(df: pd.DataFrame) -> dict:
+    # Dicionário código -> nome (apenas onde temos código e nome). Se um
+    # código aparece com mais de um nome, vale o último par distinto.
+    pares = (
+        df[["SEQ_MUNICIPIO3", "NOM_MUNICIPIO"]]
+        .dropna()
+        .drop_duplicates()
+    )
+    return dict(
+        zip(pares["SEQ_MUNICIPIO3"].tolist(), pares["NOM_MUNICIPIO"].tolist())
+    )
+
+
+class OpcoesFiltro:
+    # Opções de um multiselect (códigos presentes em ordem crescente, mais a
+    # opção SEM_* quando há nulos) com o rótulo de cada uma já formatado
+    def __init__(self, dim: Dimensao, descricoes: dict, padrao: str):
+        self.tem_nulo = dim.tem_nulo
+        self.opcoes = list(dim.valores)
+        # código -> descrição, só dos códigos presentes e descritos
+        self.descricoes = {cod: descricoes[cod] for cod in dim.valores if cod in descricoes}
+        self.rotulos = {
+            cod: f"{int(cod)} - {descricoes.get(cod, padrao)}" for cod in dim.valores
+        }
+        if dim.tem_nulo:
+            self.opcoes.append(dim.sem_valor)
+            self.rotulos[dim.sem_valor] = ROTULO_SEM_VALOR[dim.coluna]
+
+
+def opcoes_filtros(df: pd.DataFrame, dimensoes: dict) -> dict:
+    # df só precisa ter os pares SEQ_MUNICIPIO3/NOM_MUNICIPIO, na ordem do
+    # extrato (ver dicionario_municipios)
+    descricoes = {
+        "SEQ_MOTIVO_EXPEDICAO_ALVARA": (MOTIVO_MAP, NAO_INFORMADO),
+        "SEQ_STATUS": (STATUS_MAP, NAO_INFORMADO),
+    }
+    if "NOM_MUNICIPIO" in df.columns:
+        descricoes["SEQ_MUNICIPIO3"] = (dicionario_municipios(df), "")
+    return {
+        col: OpcoesFiltro(dim, *descricoes[col])
+        for col, dim in dimensoes.items()
+        if col in descricoes
+    }
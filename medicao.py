@@ -0,0 +1,139 @@
+"""Medição das etapas de cada execução do dashboard.
+
+Cada execução (o script inteiro ou só um fragmento de aba) vira uma
+``Medicao`` com as etapas do caminho quente: tempo de parede, linhas de
+entrada e saída e bytes enviados ao navegador (tabelas e gráficos). Ao
+fim da execução as etapas são gravadas como linhas JSON em
+BNMP_LOG_MEDICOES (padrão bnmp-medicoes.jsonl; vazio desliga), para
+calcular p50/p95 por etapa juntando todas as sessões.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import pandas as pd
+import pyarrow as pa
+
+ARQUIVO_LOG = os.environ.get("BNMP_LOG_MEDICOES", "bnmp-medicoes.jsonl")
+
+_trava_log = threading.Lock()
+
+
+class Etapa:
+    def __init__(self, nome: str, linhas_entrada: int | None = None):
+        self.nome = nome
+        self.segundos = 0.0
+        self.linhas_entrada = linhas_entrada
+        self.linhas_saida = None
+        self.bytes = None
+
+
+class Medicao:
+    def __init__(self, sessao: str, tipo: str):
+        self.sessao = sessao
+        self.tipo = tipo  # "app" ou o nome do fragmento reexecutado
+        self.execucao = uuid.uuid4().hex[:12]
+        self.inicio = time.time()
+        self.segundos = 0.0
+        self.etapas = []
+        self.finalizada = False
+        self._relogio = time.perf_counter()
+
+    @contextmanager
+    def etapa(self, nome: str, linhas_entrada: int | None = None):
+        # Mede o bloco; quem mede pode preencher linhas_saida e bytes no
+        # objeto devolvido (inclusive depois do bloco)
+        etapa = Etapa(nome, linhas_entrada)
+        relogio = time.perf_counter()
+        try:
+            yield etapa
+        finally:
+            etapa.segundos = time.perf_counter() - relogio
+            self.etapas.append(etapa)
+
+    def finalizar(self, arquivo: str | None = ARQUIVO_LOG) -> None:
+        self.segundos = time.perf_counter() - self._relogio
+        self.finalizada = True
+        if arquivo:
+            registrar(self.registros(), arquivo)
+
+    def registros(self) -> list:
+        # Uma linha por etapa, mais uma com o total da execução
+        base = {
+            "ts": round(self.inicio, 3),
+            "sessao": self.sessao,
+            "execucao": self.execucao,
+            "tipo": self.tipo,
+        }
+        linhas = [
+            dict(
+                base,
+                etapa=etapa.nome,
+                segundos=round(etapa.segundos, 6),
+                linhas_entrada=etapa.linhas_entrada,
+                linhas_saida=etapa.linhas_saida,
+                bytes=etapa.bytes,
+            )
+            for etapa in self.etapas
+        ]
+        linhas.append(dict(base, etapa="total", segundos=round(self.segundos, 6)))
+        return linhas
+
+    def tabela(self) -> pd.DataFrame:
+        return pd.DataFrame(self.registros()).drop(
+            columns=["ts", "sessao", "execucao", "tipo"]
+        )
+
+
+def registrar(registros: list, arquivo: str = ARQUIVO_LOG) -> None:
+    # Várias sessões gravam no mesmo arquivo: uma escrita por execução,
+    # sob trava. Falha ao gravar não pode derrubar o dashboard.
+    texto = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in registros)
+    with _trava_log:
+        try:
+            with open(arquivo, "a", encoding="utf-8") as f:
+                f.write(texto)
+        except OSError:
+            pass
+
+
+# ==========================
+# Tamanho do que vai para o navegador
+# ==========================
+def bytes_dataframe(df: pd.DataFrame) -> int:
+    # Tabelas vão ao navegador em Arrow: tamanho dos buffers
+    return pa.Table.from_pandas(df).nbytes
+
+
+def bytes_grafico(grafico, arquivo: str | None = ARQUIVO_LOG) -> int | None:
+    # Especificação Vega-Lite (com os dados embutidos) em JSON, sem validar
+    # o esquema (é o que domina o custo). Serializar o gráfico de novo custa
+    # a cada execução: só com o log ligado
+    if not arquivo:
+        return None
+    return len(grafico.to_json(validate=False, indent=None).encode("utf-8"))
+
+
+# ==========================
+# Percentis por etapa
+# ==========================
+def percentis(arquivo: str = ARQUIVO_LOG) -> pd.DataFrame:
+    # p50/p95 do tempo de cada etapa em todas as execuções registradas
+    if not arquivo or not os.path.exists(arquivo):
+        return pd.DataFrame(columns=["etapa", "execucoes", "p50", "p95"])
+    log = pd.read_json(arquivo, lines=True)
+    tempos = log.groupby("etapa")["segundos"]
+    return (
+        pd.DataFrame(
+            {
+                "execucoes": tempos.size(),
+                "p50": tempos.quantile(0.5),
+                "p95": tempos.quantile(0.95),
+            }
+        )
+        .sort_values("p95", ascending=False)
+        .reset_index()
+    )
@@ -0,0 +1,122 @@
+"""Núcleo de cálculo do dashboard, sem Streamlit.
+
+Carregar o extrato, montar as opções dos filtros, aplicar os três filtros
+e calcular os números das abas 1 a 3. O app_principal só desenha o que sai
+daqui; benchmark.py mede as mesmas funções, etapa por etapa.
+"""
+import pandas as pd
+
+from conjunto import BACKEND, abrir_conjunto
+
+
+# ==========================
+# Carga e filtros
+# ==========================
+def carregar(path: str, backend: str = BACKEND):
+    # CSV ou diretório de partições; ver conjunto.abrir_conjunto
+    return abrir_conjunto(path, backend)
+
+
+def opcoes(conjunto) -> dict:
+    # coluna -> indice.OpcoesFiltro (opções e rótulos de cada multiselect)
+    return conjunto.opcoes
+
+
+def selecoes(municipios=None, motivos=None, status=None) -> dict:
+    # Seleções no formato dos multiselects; None ou lista vazia = sem filtro
+    return {
+        col: list(valores)
+        for col, valores in (
+            ("SEQ_MUNICIPIO3", municipios),
+            ("SEQ_MOTIVO_EXPEDICAO_ALVARA", motivos),
+            ("SEQ_STATUS", status),
+        )
+        if valores
+    }
+
+
+def filtrar(conjunto, selecoes: dict):
+    return conjunto.consultar(selecoes)
+
+
+# ==========================
+# ABA 1 - Visão geral
+# ==========================
+def visao_geral(resultado, qtd_registros: int | None = None) -> dict:
+    # Métricas dos primeiros `qtd_registros` registros filtrados (todos se
+    # None), com os percentuais com/sem alvará
+    if qtd_registros is None or qtd_registros >= resultado.n_linhas:
+        resumo = dict(resultado.resumo)
+    else:
+        resumo = dict(resultado.resumo_primeiros(qtd_registros))
+
+    total_pecas = resumo["total_pecas"]
+    for chave, qtd in (
+        ("pct_com_alvara", resumo["qtd_com_alvara"]),
+        ("pct_sem_alvara", resumo["qtd_sem_alvara"]),
+    ):
+        resumo[chave] = round(qtd * 100 / total_pecas, 1) if total_pecas > 0 else 0.0
+    return resumo
+
+
+def grafico_resumo(resumo: dict) -> pd.DataFrame:
+    # Dados do gráfico de barras da ABA 1
+    return pd.DataFrame(
+        {
+            "Categoria": [
+                "Total de peças",
+                "Peças sem alvará de soltura",
+                "Peças com alvará de soltura",
+            ],
+            "Quantidade": [
+                resumo["total_pecas"],
+                resumo["qtd_sem_alvara"],
+                resumo["qtd_com_alvara"],
+            ],
+        }
+    )
+
+
+# ==========================
+# ABA 2 e ABA 3 - Contagens
+# ==========================
+def _mais_frequente(contagens: pd.DataFrame, codigo: str, rotulo: str, sem_codigo) -> tuple | None:
+    # (rótulo, quantidade) da primeira linha da contagem já ordenada
+    if contagens.empty:
+        return None
+    topo = contagens.iloc[0]
+    if pd.isna(topo[codigo]):
+        texto = sem_codigo(topo[rotulo])
+    else:
+        texto = f"{int(topo[codigo])} - {topo[rotulo]}"
+    return texto, int(topo["qtd_pecas"])
+
+
+def por_motivo(resultado) -> dict:
+    contagens = resultado.motivo_counts
+    return {
+        "contagens": contagens,
+        "total_pecas": int(contagens["qtd_pecas"].sum()),
+        "n_motivos": int(len(contagens)),
+        "mais_frequente": _mais_frequente(
+            contagens,
+            "SEQ_MOTIVO_EXPEDICAO_ALVARA",
+            "DSC_MOTIVO_EXPEDICAO_ALVARA",
+            lambda _: "SEM MOTIVO INFORMADO",
+        ),
+    }
+
+
+def por_municipio(resultado) -> dict:
+    contagens = resultado.muni_counts
+    return {
+        "contagens": contagens,
+        "total_pecas": int(contagens["qtd_pecas"].sum()),
+        "n_municipios": int(len(contagens)),
+        "mais_frequente": _mais_frequente(
+            contagens,
+            "SEQ_MUNICIPIO3",
+            "DSC_MUNICIPIO",
+            lambda nome: f"SEM MUNICÍPIO - {nome}",
+        ),
+    }
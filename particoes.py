@@ -0,0 +1,202 @@
+"""Conjunto do BNMP formado por um diretório de extratos particionados.
+
+Cada CSV do diretório (ex.: um por UF e ano de extração) é uma partição
+com o seu próprio cache colunar (ver dados.py). Na abertura só são lidos
+os manifestos e os agregados de contagem de cada partição: o cubo do
+conjunto inteiro sai da soma deles, então métricas, contagens e opções
+dos filtros não encostam nos dados de nenhuma partição.
+
+Os agregados também dizem quais códigos de município, motivo e status
+cada partição contém. Posições, linhas da tabela e ordenação só leem as
+partições que têm algum dos códigos selecionados; as demais são podadas
+sem ser abertas.
+"""
+import hashlib
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import dados
+from cache_resultados import CacheResultados
+from conjunto import LIMITE_CACHE_RESULTADOS, ConjuntoBNMP, ResultadoFiltro, _parte
+from cubo import CuboContagens, combinar
+from indice import SEM_VALOR, IndiceFiltros, opcoes_filtros
+from tabelas import SEM_NOME_MUNICIPIO
+
+
+class Particao:
+    def __init__(self, path: str, inicio: int, limite_cache: int):
+        self.path = path
+        self.tabela, self.versao, self.agregados = dados.carregar_extrato(path)
+        self.inicio = inicio  # posição global da primeira linha
+        self.n_linhas = self.tabela.num_rows
+        self._limite_cache = limite_cache
+        self._conjunto = None
+
+        # Valores presentes de cada coluna filtrável (None = há nulos)
+        self.valores = {
+            col: set(self.agregados[col].astype(object).where(self.agregados[col].notna(), None))
+            for col in SEM_VALOR
+            if col in self.agregados.columns
+        }
+
+    @property
+    def conjunto(self) -> ConjuntoBNMP:
+        # Índice e cubo da partição: montados só quando ela não é podada
+        if self._conjunto is None:
+            self._conjunto = ConjuntoBNMP(
+                self.tabela, self.versao, self.agregados, self._limite_cache
+            )
+        return self._conjunto
+
+    def pode_ter(self, filtros: list) -> bool:
+        for dim, codigos in filtros:
+            presentes = self.valores.get(dim.coluna, set())
+            nulo = len(dim.valores)
+            if not any(
+                (None if c == nulo else dim.valores[c]) in presentes for c in codigos
+            ):
+                return False
+        return True
+
+
+class ResultadoParticionado(ResultadoFiltro):
+    # Métricas e contagens vêm do cubo global (herdadas); o que depende das
+    # linhas junta os resultados das partições não podadas, em ordem
+    def __init__(self, conjunto: "ConjuntoParticionado", chave: str, selecoes: dict):
+        super().__init__(conjunto, chave, selecoes)
+        self.particoes = conjunto.podar(self.selecoes)
+
+    def _locais(self) -> list:
+        return [(p, p.conjunto.consultar(self.selecoes)) for p in self.particoes]
+
+    @_parte
+    def posicoes(self) -> np.ndarray:
+        posicoes = np.concatenate(
+            [np.empty(0, dtype=np.int64)]
+            + [p.inicio + r.posicoes.astype(np.int64) for p, r in self._locais()]
+        )
+        posicoes.flags.writeable = False
+        return posicoes
+
+    @_parte
+    def acumulados(self) -> dict:
+        # Mesmos acumulados do ResultadoFiltro, mas os códigos densos são
+        # de cada partição: as primeiras ocorrências saem dos valores
+        colunas = [
+            col
+            for col in ("SEQ_PECA", "TEM_ALVARA", "SEQ_MUNICIPIO3", "SEQ_MOTIVO_EXPEDICAO_ALVARA")
+            if col in self._conjunto.colunas
+        ]
+        df = self._conjunto.linhas(self.posicoes, colunas)
+        tipo = np.int32 if len(df) < np.iinfo(np.int32).max else np.int64
+
+        if "SEQ_PECA" in df.columns:
+            pecas = df["SEQ_PECA"].notna().to_numpy()
+        else:
+            pecas = np.ones(len(df), dtype=bool)
+        acumulados = {"pecas": np.cumsum(pecas, dtype=tipo)}
+        if "TEM_ALVARA" in df.columns:
+            acumulados["com_alvara"] = np.cumsum(df["TEM_ALVARA"].to_numpy(), dtype=tipo)
+        for col, nome in (
+            ("SEQ_MUNICIPIO3", "municipios"),
+            ("SEQ_MOTIVO_EXPEDICAO_ALVARA", "motivos"),
+        ):
+            if col in df.columns:
+                primeira = (~df[col].duplicated() & df[col].notna()).to_numpy()
+                acumulados[nome] = np.cumsum(primeira, dtype=tipo)
+        return acumulados
+
+    def _ordenar(self, coluna: str, decrescente: bool) -> np.ndarray:
+        pedacos = []
+        for p, r in self._locais():
+            valores = p.tabela.column(coluna).take(pa.array(r.posicoes, type=pa.int64()))
+            if pa.types.is_dictionary(valores.type):
+                valores = valores.cast(pa.string())  # dicionários diferem por partição
+            pedacos.extend(valores.chunks)
+        tipo = pedacos[0].type if pedacos else pa.int64()
+        ordem = pc.array_sort_indices(
+            pa.chunked_array(pedacos, type=tipo).combine_chunks(),
+            order="descending" if decrescente else "ascending",
+            null_placement="at_end",
+        ).to_numpy()
+        return self.posicoes[ordem]
+
+
+class ConjuntoParticionado(ConjuntoBNMP):
+    Resultado = ResultadoParticionado
+
+    def __init__(self, paths: list, limite_cache: int = LIMITE_CACHE_RESULTADOS):
+        # Cada partição fica com uma fração do limite do cache de resultados
+        limite_particao = limite_cache // max(len(paths), 1)
+        self.particoes = []
+        inicio = 0
+        for path in paths:
+            particao = Particao(path, inicio, limite_particao)
+            self.particoes.append(particao)
+            inicio += particao.n_linhas
+        self.inicios = np.array([p.inicio for p in self.particoes], dtype=np.int64)
+
+        self.tabela = None  # não há tabela única; ver linhas()
+        self.versao = hashlib.blake2b(
+            repr([p.versao for p in self.particoes]).encode(), digest_size=16
+        ).hexdigest()
+        self.colunas = self.particoes[0].tabela.column_names if self.particoes else []
+        self.n_linhas = inicio
+
+        # Índice, opções e cubo sobre os agregados somados: as dimensões têm
+        # só os valores distintos, que é tudo que o cubo e as opções usam
+        agregados = combinar([p.agregados for p in self.particoes])
+        self.indice = IndiceFiltros(agregados)
+        self.opcoes = opcoes_filtros(_pares_municipios(agregados), self.indice.dimensoes)
+        self.cubo = CuboContagens(agregados, self.indice)
+        self.resultados = CacheResultados(limite_cache)
+
+    @classmethod
+    def de_diretorio(cls, diretorio: str) -> "ConjuntoParticionado":
+        paths = dados.arquivos_particoes(diretorio)
+        if not paths:
+            raise FileNotFoundError(f"Nenhum CSV encontrado em {diretorio}")
+        return cls(paths)
+
+    def podar(self, selecoes: dict) -> list:
+        filtros = self.indice.filtros(selecoes)
+        return [p for p in self.particoes if p.pode_ter(filtros)]
+
+    def linhas(self, posicoes: np.ndarray, colunas: list | None = None) -> pd.DataFrame:
+        # Lê cada partição só pelas linhas pedidas e devolve na ordem pedida
+        posicoes = np.asarray(posicoes, dtype=np.int64)
+        qual = np.searchsorted(self.inicios, posicoes, side="right") - 1
+        partes = []
+        for i in np.unique(qual):
+            p = self.particoes[i]
+            globais = posicoes[qual == i]
+            tabela = p.tabela if colunas is None else p.tabela.select(colunas)
+            df = dados.para_pandas(
+                tabela.take(pa.array(globais - p.inicio, type=pa.int64()))
+            )
+            df.index = pd.Index(globais, dtype=np.int64)
+            partes.append(df)
+        if not partes:
+            tabela = self.particoes[0].tabela
+            tabela = tabela if colunas is None else tabela.select(colunas)
+            return dados.para_pandas(tabela.slice(0, 0))
+
+        df = pd.concat(partes).reindex(posicoes)
+        # Categorias diferentes por partição viram object no concat
+        for col in partes[0].columns:
+            if isinstance(partes[0][col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].astype("category")
+        return df
+
+
+def _pares_municipios(agregados: pd.DataFrame) -> pd.DataFrame:
+    # Pares código/nome para os rótulos do filtro de município. Os agregados
+    # não guardam NOM_MUNICIPIO, só o nome derivado (sem espaços nas pontas)
+    if "SEQ_MUNICIPIO3" not in agregados.columns or "DSC_MUNICIPIO" not in agregados.columns:
+        return pd.DataFrame()
+    pares = agregados[["SEQ_MUNICIPIO3", "DSC_MUNICIPIO"]].astype({"DSC_MUNICIPIO": object})
+    pares = pares[pares["DSC_MUNICIPIO"] != SEM_NOME_MUNICIPIO]
+    return pares.rename(columns={"DSC_MUNICIPIO": "NOM_MUNICIPIO"})
@@ -0,0 +1,186 @@
+"""Relatório de qualidade dos dados de um extrato do BNMP.
+
+O dashboard absorve dados ruins sem avisar: códigos malformados viram nulo
+na conversão (e caem nas opções SEM_*), códigos fora do MOTIVO_MAP e do
+STATUS_MAP viram "Não informado / Outro" e um mesmo SEQ_MUNICIPIO3 pode
+aparecer com mais de um nome. Este módulo conta esses casos, mais os
+SEQ_PECA repetidos.
+
+O relatório é calculado uma vez por versão dos dados, na ingestão (ver
+dados.py): as falhas de conversão são contadas bloco a bloco em
+dados.tipar, os códigos desconhecidos e os conflitos de nome saem dos
+agregados do cubo e os SEQ_PECA repetidos de uma contagem por hash na
+coluna do cache, feita em passadas (cada uma conta só uma faixa de hashes)
+para a memória não crescer com o número de peças distintas. Tudo fica
+gravado no manifesto do cache, então exibir o relatório só lê esse JSON.
+"""
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from tabelas import MOTIVO_MAP, SEM_NOME_MUNICIPIO, STATUS_MAP
+
+# Exemplos guardados por verificação (os mais frequentes)
+N_EXEMPLOS = 10
+
+# Códigos contados por passada na busca de SEQ_PECA repetidos (~32 MB de
+# int64, mais a tabela de contagem)
+CODIGOS_POR_PASSADA = 4_000_000
+
+# Coluna de código -> tabela de domínio que a rotula
+DOMINIOS = {
+    "SEQ_MOTIVO_EXPEDICAO_ALVARA": MOTIVO_MAP,
+    "SEQ_STATUS": STATUS_MAP,
+}
+
+
+def contar_falhas(falhas: dict, coluna: str, bruto: pd.Series, convertido: pd.Series) -> None:
+    # Valor presente no CSV que virou nulo na conversão para número
+    falhas[coluna] = falhas.get(coluna, 0) + int((convertido.isna() & bruto.notna()).sum())
+
+
+def _desconhecidos(agregados: pd.DataFrame, coluna: str, dominio: dict) -> dict:
+    codigos = agregados[coluna]
+    fora = agregados[codigos.notna() & ~codigos.isin(list(dominio))]
+    por_codigo = fora.groupby(coluna)["linhas"].sum().sort_values(ascending=False)
+    return {
+        "linhas": int(por_codigo.sum()),
+        "codigos": int(len(por_codigo)),
+        "exemplos": [
+            {"codigo": int(codigo), "linhas": int(linhas)}
+            for codigo, linhas in por_codigo.head(N_EXEMPLOS).items()
+        ],
+    }
+
+
+def _conflitos_municipio(agregados: pd.DataFrame) -> dict:
+    # Códigos com mais de um nome (já sem espaços nas pontas, como no
+    # dashboard); linhas sem nome não contam como conflito
+    pares = agregados[
+        agregados["SEQ_MUNICIPIO3"].notna()
+        & (agregados["DSC_MUNICIPIO"] != SEM_NOME_MUNICIPIO)
+    ]
+    pares = (
+        pares.groupby(["SEQ_MUNICIPIO3", "DSC_MUNICIPIO"], observed=True)["linhas"]
+        .sum()
+        .reset_index()
+    )
+    nomes = pares.groupby("SEQ_MUNICIPIO3")["DSC_MUNICIPIO"].transform("size")
+    conflitos = pares[nomes > 1]
+    por_codigo = conflitos.groupby("SEQ_MUNICIPIO3")["linhas"].sum().sort_values(
+        ascending=False
+    )
+    return {
+        "linhas": int(por_codigo.sum()),
+        "codigos": int(len(por_codigo)),
+        "exemplos": [
+            {
+                "codigo": int(codigo),
+                "linhas": int(linhas),
+                "nomes": conflitos.loc[
+                    conflitos["SEQ_MUNICIPIO3"] == codigo, "DSC_MUNICIPIO"
+                ].astype(str).tolist(),
+            }
+            for codigo, linhas in por_codigo.head(N_EXEMPLOS).items()
+        ],
+    }
+
+
+def _faixa(valores: np.ndarray, passadas: int) -> np.ndarray:
+    # Espalha os códigos (sequenciais) entre as passadas por um hash
+    # multiplicativo, para cada passada receber uma fatia parecida
+    misturados = valores.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    return (misturados >> np.uint64(32)) % np.uint64(passadas)
+
+
+def _repetidos(coluna: pa.ChunkedArray, por_passada: int = CODIGOS_POR_PASSADA) -> dict:
+    # Contagem de valores por hash (linear); nulos não contam. Um código cai
+    # sempre na mesma passada, então cada passada conta seus códigos por
+    # inteiro e só guarda ~por_passada deles: a memória fica limitada,
+    # ao custo de reler a coluna (memory-map) uma vez por passada
+    passadas = max(1, -(-len(coluna) // por_passada))
+    linhas = codigos = 0
+    exemplos = []
+    for passada in range(passadas):
+        pedacos = []
+        for bloco in coluna.chunks:
+            bloco = bloco.drop_null()
+            if passadas > 1:
+                valores = bloco.to_numpy(zero_copy_only=False)
+                bloco = pa.array(valores[_faixa(valores, passadas) == passada])
+            pedacos.append(bloco)
+        contagem = pc.value_counts(pa.chunked_array(pedacos, type=coluna.type))
+        valores = contagem.field("values").to_numpy(zero_copy_only=False)
+        vezes = contagem.field("counts").to_numpy(zero_copy_only=False)
+        repetidos = vezes > 1
+        linhas += int((vezes[repetidos] - 1).sum())  # além da primeira
+        codigos += int(repetidos.sum())
+        ordem = np.argsort(-vezes[repetidos], kind="stable")[:N_EXEMPLOS]
+        exemplos.extend(zip(valores[repetidos][ordem], vezes[repetidos][ordem]))
+    exemplos.sort(key=lambda exemplo: -exemplo[1])
+    return {
+        "linhas": linhas,
+        "codigos": codigos,
+        "exemplos": [
+            {"codigo": int(valor), "linhas": int(n)} for valor, n in exemplos[:N_EXEMPLOS]
+        ],
+    }
+
+
+def avaliar(tabela: pa.Table, agregados: pd.DataFrame, falhas: dict) -> dict:
+    # Relatório (serializável em JSON) de um extrato já ingerido
+    relatorio = {
+        "linhas": tabela.num_rows,
+        "falhas_conversao": {col: int(n) for col, n in falhas.items()},
+    }
+    relatorio["codigos_desconhecidos"] = {
+        col: _desconhecidos(agregados, col, dominio)
+        for col, dominio in DOMINIOS.items()
+        if col in agregados.columns
+    }
+    if {"SEQ_MUNICIPIO3", "DSC_MUNICIPIO"} <= set(agregados.columns):
+        relatorio["municipios_conflitantes"] = _conflitos_municipio(agregados)
+    if "SEQ_PECA" in tabela.column_names:
+        relatorio["seq_peca_repetidos"] = _repetidos(tabela.column("SEQ_PECA"))
+    return relatorio
+
+
+def tabela(relatorios: dict) -> pd.DataFrame:
+    # Uma linha por arquivo e verificação, para exibir: arquivo -> relatório
+    linhas = []
+    for arquivo, relatorio in relatorios.items():
+        if relatorio is None:
+            linhas.append({"arquivo": arquivo, "verificacao": "relatório indisponível"})
+            continue
+        for col, n in relatorio["falhas_conversao"].items():
+            linhas.append(
+                {"arquivo": arquivo, "verificacao": "falha de conversão", "coluna": col, "linhas": n}
+            )
+        for col, item in relatorio.get("codigos_desconhecidos", {}).items():
+            linhas.append(
+                {"arquivo": arquivo, "verificacao": "código fora da tabela", "coluna": col, **item}
+            )
+        for verificacao, col, chave in (
+            ("código com mais de um nome", "SEQ_MUNICIPIO3", "municipios_conflitantes"),
+            ("SEQ_PECA repetido", "SEQ_PECA", "seq_peca_repetidos"),
+        ):
+            if chave in relatorio:
+                linhas.append(
+                    {"arquivo": arquivo, "verificacao": verificacao, "coluna": col, **relatorio[chave]}
+                )
+    df = pd.DataFrame(
+        linhas, columns=["arquivo", "verificacao", "coluna", "linhas", "codigos", "exemplos"]
+    ).astype({"linhas": "Int64", "codigos": "Int64"})
+    df["exemplos"] = df["exemplos"].map(
+        lambda exemplos: ", ".join(_exemplo(e) for e in exemplos)
+        if isinstance(exemplos, list)
+        else ""
+    )
+    return df
+
+
+def _exemplo(exemplo: dict) -> str:
+    nomes = f" ({' / '.join(exemplo['nomes'])})" if "nomes" in exemplo else ""
+    return f"{exemplo['codigo']}{nomes}: {exemplo['linhas']}"
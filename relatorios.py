@@ -0,0 +1,231 @@
+"""Relatórios em lote do BNMP: um por município (ou por motivo, ou status).
+
+Cada relatório tem as métricas da ABA 1, as contagens por motivo e por
+município e os três gráficos do dashboard, calculados com as mesmas
+funções (nucleo.py e graficos.py) para a seleção de um único valor do
+filtro. Saída, em <saida>/<por>/:
+
+    <valor>.html         um HTML estático por valor (gráficos via Vega-Embed)
+    index.html           lista dos relatórios, do maior para o menor
+    resumo.parquet       métricas da ABA 1, uma linha por valor
+    motivos.parquet      contagens por motivo de cada valor
+    municipios.parquet   contagens por município de cada valor
+
+Uso:
+    python relatorios.py --dados BNMP_MORADOR_RUA.CSV --por municipio --saida relatorios
+
+O processo principal monta o cache colunar se preciso. Os relatórios só
+usam o cubo de contagens, então cada processo do pool abre o conjunto só
+pelo manifesto e pelos agregados do cache (ver abrir_agregados): índice e
+cubo sobre as combinações distintas, sem ler o CSV nem montar nada por
+linha.
+"""
+import argparse
+import functools
+import html
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import altair as alt
+import pandas as pd
+
+import graficos
+import nucleo
+from particoes import ConjuntoParticionado
+
+# --por -> coluna do filtro
+DIMENSOES = {
+    "municipio": "SEQ_MUNICIPIO3",
+    "motivo": "SEQ_MOTIVO_EXPEDICAO_ALVARA",
+    "status": "SEQ_STATUS",
+}
+
+MODELO_HTML = """<!DOCTYPE html>
+<html lang="pt-BR">
+<head>
+<meta charset="utf-8">
+<title>{titulo}</title>
+<script src="https://cdn.jsdelivr.net/npm/vega@{vega}"></script>
+<script src="https://cdn.jsdelivr.net/npm/vega-lite@{vegalite}"></script>
+<script src="https://cdn.jsdelivr.net/npm/vega-embed@{vegaembed}"></script>
+</head>
+<body>
+<h1>{titulo}</h1>
+{corpo}
+</body>
+</html>
+"""
+
+# Conjunto aberto em cada processo do pool (ver _iniciar)
+_conjunto = None
+
+
+def abrir_agregados(path: str) -> ConjuntoParticionado:
+    # CSV ou diretório, sempre como partições: o ConjuntoParticionado monta
+    # índice, opções e cubo só a partir dos agregados e só abre os dados de
+    # uma partição (por memory-map) se alguém pedir posições ou linhas
+    if os.path.isdir(path):
+        return ConjuntoParticionado.de_diretorio(path)
+    return ConjuntoParticionado([path])
+
+
+def _iniciar(path: str) -> None:
+    global _conjunto
+    _conjunto = abrir_agregados(path)
+
+
+# ==========================
+# HTML
+# ==========================
+def _pagina(titulo: str, corpo: str) -> str:
+    return MODELO_HTML.format(
+        titulo=html.escape(titulo),
+        corpo=corpo,
+        vega=alt.VEGA_VERSION,
+        vegalite=alt.VEGALITE_VERSION,
+        vegaembed=alt.VEGAEMBED_VERSION,
+    )
+
+
+def _grafico_html(id_div: str, grafico) -> str:
+    # Sem validar o esquema a cada relatório (os gráficos são sempre os
+    # mesmos). "</" escapado: um nome com "</script>" não fecha o script
+    especificacao = grafico.to_json(validate=False, indent=None).replace("</", "<\\/")
+    return (
+        f'<div id="{id_div}"></div>\n'
+        f'<script>vegaEmbed("#{id_div}", {especificacao});</script>'
+    )
+
+
+def _tabela_html(df: pd.DataFrame) -> str:
+    return df.to_html(index=False, na_rep="", border=0)
+
+
+# ==========================
+# Relatório de um valor
+# ==========================
+def relatorio(coluna: str, valor, rotulo: str, diretorio: str, top: int) -> tuple:
+    # Roda num processo do pool: grava o HTML e devolve as linhas dos
+    # Parquets (métricas e contagens) para o processo principal juntar
+    resultado = nucleo.filtrar(_conjunto, {coluna: [valor]})
+    resumo = nucleo.visao_geral(resultado)
+    motivos = nucleo.por_motivo(resultado)
+    municipios = nucleo.por_municipio(resultado)
+
+    metricas = pd.DataFrame(
+        {
+            "Métrica": [
+                "Total de peças",
+                "Peças sem alvará de soltura",
+                "Peças com alvará de soltura",
+                "Municípios distintos",
+                "Motivos distintos de alvará",
+                "% com alvará / sem alvará",
+            ],
+            "Valor": [
+                resumo["total_pecas"],
+                resumo["qtd_sem_alvara"],
+                resumo["qtd_com_alvara"],
+                resumo["municipios_distintos"],
+                resumo["motivos_distintos"],
+                f"{resumo['pct_com_alvara']}% / {resumo['pct_sem_alvara']}%",
+            ],
+        }
+    )
+    corpo = "\n".join(
+        [
+            "<h2>Visão geral</h2>",
+            _tabela_html(metricas),
+            _grafico_html("resumo", graficos.barras_resumo(nucleo.grafico_resumo(resumo))),
+            "<h2>Por motivo do alvará</h2>",
+            _grafico_html("motivos", graficos.barras_motivos(motivos["contagens"], top)),
+            _tabela_html(motivos["contagens"]),
+            "<h2>Por município</h2>",
+            _grafico_html("municipios", graficos.barras_municipios(municipios["contagens"], top)),
+            _tabela_html(municipios["contagens"]),
+        ]
+    )
+    with open(os.path.join(diretorio, f"{valor}.html"), "w", encoding="utf-8") as f:
+        f.write(_pagina(rotulo, corpo))
+
+    # Valores numéricos e opções SEM_* na mesma coluna: guardados como texto
+    fatia = {"coluna": coluna, "valor": str(valor), "rotulo": rotulo}
+    linha = dict(fatia, n_linhas=resultado.n_linhas, **resumo)
+    return (
+        linha,
+        motivos["contagens"].assign(**fatia),
+        municipios["contagens"].assign(**fatia),
+    )
+
+
+# ==========================
+# Lote
+# ==========================
+def gerar(
+    path: str,
+    por: str,
+    saida: str,
+    processos: int | None = None,
+    top: int = graficos.TOP_GRAFICOS,
+) -> pd.DataFrame:
+    coluna = DIMENSOES[por]
+    conjunto = abrir_agregados(path)  # monta o cache antes do pool
+    filtro = nucleo.opcoes(conjunto)[coluna]
+    rotulos = [filtro.rotulos[valor] for valor in filtro.opcoes]
+
+    diretorio = os.path.join(saida, por)
+    os.makedirs(diretorio, exist_ok=True)
+    processos = processos or os.cpu_count()
+    tarefa = functools.partial(relatorio, coluna, diretorio=diretorio, top=top)
+    with ProcessPoolExecutor(
+        processos, initializer=_iniciar, initargs=(path,)
+    ) as pool:
+        partes = list(
+            pool.map(
+                tarefa,
+                filtro.opcoes,
+                rotulos,
+                chunksize=max(1, len(rotulos) // (processos * 4)),
+            )
+        )
+
+    resumo = pd.DataFrame([linha for linha, _, _ in partes])
+    resumo = resumo.sort_values("total_pecas", ascending=False, kind="stable")
+    resumo.to_parquet(os.path.join(diretorio, "resumo.parquet"), index=False)
+    for nome, i in (("motivos", 1), ("municipios", 2)):
+        contagens = pd.concat([parte[i] for parte in partes], ignore_index=True)
+        # Categorias diferentes por valor viram texto no concat
+        contagens.to_parquet(os.path.join(diretorio, f"{nome}.parquet"), index=False)
+
+    itens = "\n".join(
+        f'<li><a href="{html.escape(linha.valor)}.html">'
+        f"{html.escape(linha.rotulo)}</a> ({linha.total_pecas} peças)</li>"
+        for linha in resumo.itertuples()
+    )
+    with open(os.path.join(diretorio, "index.html"), "w", encoding="utf-8") as f:
+        f.write(_pagina(f"Relatórios BNMP por {por}", f"<ul>\n{itens}\n</ul>"))
+    return resumo
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--dados", default=os.environ.get("BNMP_DADOS", "BNMP_MORADOR_RUA.CSV")
+    )
+    parser.add_argument("--por", choices=list(DIMENSOES), default="municipio")
+    parser.add_argument("--saida", default="relatorios-bnmp")
+    parser.add_argument("--processos", type=int, help="padrão: um por núcleo")
+    parser.add_argument("--top", type=int, default=graficos.TOP_GRAFICOS)
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    resumo = gerar(args.dados, args.por, args.saida, args.processos, args.top)
+    print(
+        f"{len(resumo)} relatórios em {os.path.join(args.saida, args.por)} "
+        f"({time.perf_counter() - inicio:.1f}s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,422 @@
+"""Serviço local de agregação compartilhado por várias réplicas do dashboard.
+
+Um processo à parte (``python servico.py``) é dono do conjunto: carrega o
+extrato, o índice dos filtros e o cubo uma vez e responde às consultas de
+filtro e agregação das réplicas por um socket local (Unix, ou TCP com
+"host:porta"). Cada réplica usa um ``ConjuntoRemoto``, com a mesma
+interface do ConjuntoBNMP: só as opções dos filtros e os resultados que as
+suas sessões pedem ficam na memória dela.
+
+Protocolo: cada mensagem é um stream Arrow IPC precedido do tamanho (4
+bytes, big-endian). Os parâmetros e os valores pequenos (operação,
+seleções, resumo das métricas) vão em JSON nos metadados do esquema;
+posições, contagens e linhas vão como colunas Arrow, sem conversão para
+texto.
+
+Por TCP o serviço só atende no loopback, a menos que BNMP_SERVICO_SEGREDO
+esteja definido (no serviço e nas réplicas): cada consulta leva o segredo
+e o serviço recusa as que não o têm. Não há criptografia: o segredo e os
+dados trafegam em claro, então fora do loopback use só uma rede confiável
+(ou um túnel, como SSH ou VPN, entre as réplicas e o serviço).
+
+Para testes, ``TransporteLocal`` responde no próprio processo, passando
+pela mesma serialização, sem socket.
+
+Uso:
+    python servico.py --dados BNMP_MORADOR_RUA.CSV --endereco /tmp/bnmp.sock
+    BNMP_SERVICO=/tmp/bnmp.sock streamlit run app.py
+"""
+import argparse
+import hmac
+import ipaddress
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+import nucleo
+from cache_resultados import CacheResultados
+from conjunto import BACKEND, LIMITE_CACHE_RESULTADOS, ConjuntoBase, ResultadoBase, _parte
+from indice import SEM_VALOR, Dimensao, opcoes_filtros
+
+CHAVE_METADADOS = b"bnmp"
+
+# Segredo compartilhado entre o serviço e as réplicas. Obrigatório para
+# atender por TCP fora do loopback: o serviço entrega o extrato inteiro sem
+# passar pelo login do dashboard. Vai em claro, como os dados (sem TLS)
+SEGREDO = os.environ.get("BNMP_SERVICO_SEGREDO", "")
+
+
+# ==========================
+# Mensagens
+# ==========================
+def _json_padrao(valor):
+    # Escalares do numpy (códigos, contagens) viram int/float do Python
+    if isinstance(valor, np.generic):
+        return valor.item()
+    raise TypeError(f"Valor não serializável: {valor!r}")
+
+
+def codificar(meta: dict, tabela: pa.Table | None = None) -> bytes:
+    tabela = tabela if tabela is not None else pa.table({})
+    texto = json.dumps(meta, default=_json_padrao, ensure_ascii=False).encode("utf-8")
+    tabela = tabela.replace_schema_metadata(
+        {**(tabela.schema.metadata or {}), CHAVE_METADADOS: texto}
+    )
+    saida = pa.BufferOutputStream()
+    with pa.ipc.new_stream(saida, tabela.schema) as escritor:
+        if tabela.num_rows or not tabela.num_columns:
+            escritor.write_table(tabela)
+        else:
+            # Um lote vazio explícito: sem nenhum lote os dicionários não são
+            # enviados e as categorias das colunas se perdem
+            escritor.write_batch(
+                pa.RecordBatch.from_arrays(
+                    [coluna.combine_chunks() for coluna in tabela.columns],
+                    schema=tabela.schema,
+                )
+            )
+    return saida.getvalue().to_pybytes()
+
+
+def decodificar(mensagem: bytes) -> tuple[dict, pa.Table]:
+    tabela = pa.ipc.open_stream(mensagem).read_all()
+    meta = json.loads(tabela.schema.metadata[CHAVE_METADADOS])
+    return meta, tabela
+
+
+def para_tabela(df: pd.DataFrame) -> pa.Table:
+    # Com o metadado do pandas: índice e categorias voltam iguais
+    return pa.Table.from_pandas(df)
+
+
+def para_df(tabela: pa.Table) -> pd.DataFrame:
+    # Os tipos (Int*, categorias) e o índice vêm do metadado do pandas
+    return tabela.to_pandas()
+
+
+def _enviar(conexao: socket.socket, mensagem: bytes) -> None:
+    conexao.sendall(struct.pack("!I", len(mensagem)) + mensagem)
+
+
+def _ler(conexao: socket.socket, n: int) -> bytes:
+    partes = []
+    while n:
+        parte = conexao.recv(min(n, 1 << 20))
+        if not parte:
+            raise ConnectionError("Conexão com o serviço de agregação encerrada")
+        partes.append(parte)
+        n -= len(parte)
+    return b"".join(partes)
+
+
+def _receber(conexao: socket.socket) -> bytes:
+    (tamanho,) = struct.unpack("!I", _ler(conexao, 4))
+    return _ler(conexao, tamanho)
+
+
+# ==========================
+# Servidor
+# ==========================
+def _info(conjunto) -> dict:
+    # Só o necessário para a réplica montar as dimensões e as opções dos
+    # filtros: valores distintos de cada coluna filtrável e os nomes dos
+    # municípios que o servidor usa nos rótulos
+    municipios = {}
+    if "SEQ_MUNICIPIO3" in conjunto.opcoes:
+        municipios = conjunto.opcoes["SEQ_MUNICIPIO3"].descricoes
+    return {
+        "versao": conjunto.versao,
+        "colunas": list(conjunto.colunas),
+        "n_linhas": int(conjunto.n_linhas),
+        "dimensoes": {
+            col: {"valores": dim.valores, "tem_nulo": dim.tem_nulo, "dtype": str(dim.dtype)}
+            for col, dim in conjunto.dimensoes.items()
+        },
+        "municipios": [[int(cod), nome] for cod, nome in municipios.items()],
+    }
+
+
+def _coluna(conjunto, nome) -> str:
+    # Nomes de coluna vindos do socket só passam se forem colunas do
+    # conjunto: o backend SQL os coloca no texto da consulta
+    if nome not in conjunto.colunas:
+        raise ValueError(f"Coluna desconhecida: {nome!r}")
+    return nome
+
+
+def responder(conjunto, mensagem: bytes, segredo: str = "") -> bytes:
+    # Uma consulta -> uma resposta; erros voltam como {"erro": ...}
+    try:
+        meta, tabela = decodificar(mensagem)
+        if segredo and not hmac.compare_digest(
+            str(meta.get("segredo", "")).encode(), segredo.encode()
+        ):
+            return codificar({"erro": "acesso negado"})
+        operacao = meta["op"]
+        if operacao == "info":
+            return codificar(_info(conjunto))
+        if meta.get("versao") != conjunto.versao:
+            # Réplica montada sobre outro extrato (o serviço reiniciou com
+            # dados novos): as opções e posições dela não valem mais aqui
+            return codificar(
+                {"erro": "versão dos dados mudou", "versao": conjunto.versao}
+            )
+        if operacao == "linhas":
+            posicoes = tabela.column("posicao").to_numpy()
+            colunas = meta.get("colunas")
+            if colunas is not None:
+                colunas = [_coluna(conjunto, col) for col in colunas]
+            return codificar({}, para_tabela(conjunto.linhas(posicoes, colunas)))
+
+        resultado = nucleo.filtrar(conjunto, meta["selecoes"])
+        if operacao in ("n_linhas", "resumo"):
+            return codificar({"valor": getattr(resultado, operacao)})
+        if operacao == "resumo_primeiros":
+            return codificar({"valor": resultado.resumo_primeiros(int(meta["n"]))})
+        if operacao == "posicoes":
+            return codificar({}, pa.table({"posicao": resultado.posicoes}))
+        if operacao == "ordenadas":
+            ordenadas = resultado.ordenadas(
+                _coluna(conjunto, meta["coluna"]), bool(meta["decrescente"])
+            )
+            return codificar({}, pa.table({"posicao": ordenadas}))
+        if operacao in ("motivo_counts", "muni_counts"):
+            return codificar({}, para_tabela(getattr(resultado, operacao)))
+        raise ValueError(f"Operação desconhecida: {operacao}")
+    except Exception as erro:  # a réplica levanta o erro do lado dela
+        return codificar({"erro": f"{type(erro).__name__}: {erro}"})
+
+
+class _Atendimento(socketserver.BaseRequestHandler):
+    # Uma conexão por réplica, com várias consultas em sequência
+    def handle(self):
+        while True:
+            try:
+                mensagem = _receber(self.request)
+            except ConnectionError:
+                return
+            _enviar(
+                self.request,
+                responder(self.server.conjunto, mensagem, self.server.segredo),
+            )
+
+
+def _endereco(endereco: str):
+    # "host:porta" = TCP; qualquer outra coisa é o caminho de um socket Unix
+    host, _, porta = endereco.rpartition(":")
+    if host and porta.isdigit():
+        return socket.AF_INET, (host, int(porta))
+    return socket.AF_UNIX, endereco
+
+
+def _loopback(host: str) -> bool:
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+
+def servir(conjunto, endereco: str, segredo: str = SEGREDO) -> socketserver.BaseServer:
+    familia, alvo = _endereco(endereco)
+    if familia == socket.AF_INET and not segredo and not _loopback(alvo[0]):
+        raise ValueError(
+            f"{endereco}: sem BNMP_SERVICO_SEGREDO, o serviço só atende por TCP "
+            "no loopback (ex.: 127.0.0.1:porta)"
+        )
+    if familia == socket.AF_UNIX:
+        if os.path.exists(alvo):
+            os.remove(alvo)  # socket de uma execução anterior
+        servidor = socketserver.ThreadingUnixStreamServer(alvo, _Atendimento)
+    else:
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        servidor = socketserver.ThreadingTCPServer(alvo, _Atendimento)
+    servidor.daemon_threads = True
+    servidor.conjunto = conjunto
+    servidor.segredo = segredo
+    return servidor
+
+
+# ==========================
+# Cliente
+# ==========================
+class VersaoDesatualizada(RuntimeError):
+    # O serviço passou a servir outra versão do extrato: a réplica precisa
+    # de um ConjuntoRemoto novo (opções e resultados em cache não valem mais)
+    pass
+
+
+class TransporteSocket:
+    # Uma conexão por réplica, compartilhada pelas sessões (uma consulta por
+    # vez). Se o serviço reiniciar, reconecta uma vez e repete a consulta.
+    def __init__(self, endereco: str):
+        self.endereco = endereco
+        self._conexao = None
+        self._trava = threading.Lock()
+
+    def _conectar(self) -> socket.socket:
+        familia, alvo = _endereco(self.endereco)
+        conexao = socket.socket(familia, socket.SOCK_STREAM)
+        conexao.connect(alvo)
+        return conexao
+
+    def pedir(self, mensagem: bytes) -> bytes:
+        with self._trava:
+            for tentativa in range(2):
+                try:
+                    if self._conexao is None:
+                        self._conexao = self._conectar()
+                    _enviar(self._conexao, mensagem)
+                    return _receber(self._conexao)
+                except OSError:
+                    if self._conexao is not None:
+                        self._conexao.close()
+                    self._conexao = None
+                    if tentativa:
+                        raise
+
+
+class TransporteLocal:
+    # Substituto em processo para testes: mesmo protocolo, sem socket
+    def __init__(self, conjunto):
+        self.conjunto = conjunto
+
+    def pedir(self, mensagem: bytes) -> bytes:
+        return responder(self.conjunto, mensagem)
+
+
+class ResultadoRemoto(ResultadoBase):
+    # Mesmas partes do conjunto.ResultadoFiltro, cada uma pedida ao serviço
+    # na primeira vez que alguma aba precisa
+    def _pedir(self, operacao: str, **parametros) -> tuple[dict, pa.Table]:
+        return self._conjunto.pedir(operacao, selecoes=self.selecoes, **parametros)
+
+    def _posicoes(self, operacao: str, **parametros) -> np.ndarray:
+        _, tabela = self._pedir(operacao, **parametros)
+        posicoes = tabela.column("posicao").to_numpy()
+        if posicoes.flags.writeable:
+            posicoes.flags.writeable = False
+        return posicoes
+
+    @_parte
+    def posicoes(self) -> np.ndarray:
+        return self._posicoes("posicoes")
+
+    @_parte
+    def n_linhas(self) -> int:
+        if "posicoes" in self.__dict__:
+            return len(self.posicoes)
+        return self._pedir("n_linhas")[0]["valor"]
+
+    @_parte
+    def resumo(self) -> dict:
+        return self._pedir("resumo")[0]["valor"]
+
+    def resumo_primeiros(self, n: int) -> dict:
+        return self._pedir("resumo_primeiros", n=int(n))[0]["valor"]
+
+    @_parte
+    def motivo_counts(self) -> pd.DataFrame:
+        return para_df(self._pedir("motivo_counts")[1])
+
+    @_parte
+    def muni_counts(self) -> pd.DataFrame:
+        return para_df(self._pedir("muni_counts")[1])
+
+    def _ordenar(self, coluna: str, decrescente: bool) -> np.ndarray:
+        return self._posicoes("ordenadas", coluna=coluna, decrescente=bool(decrescente))
+
+
+class ConjuntoRemoto(ConjuntoBase):
+    Resultado = ResultadoRemoto
+
+    def __init__(
+        self,
+        transporte,
+        limite_cache: int = LIMITE_CACHE_RESULTADOS,
+        segredo: str = SEGREDO,
+    ):
+        self.transporte = transporte
+        self.segredo = segredo
+        info, _ = self.pedir("info")
+        self.versao = info["versao"]
+        self.colunas = info["colunas"]
+        self.n_linhas = info["n_linhas"]
+
+        # Dimensões montadas só sobre os valores distintos (como no
+        # ConjuntoSQL): mesma regra de seleção e mesmas chaves do servidor
+        self.dimensoes = {
+            col: Dimensao(
+                pd.Series(
+                    d["valores"] + ([None] if d["tem_nulo"] else []),
+                    dtype=d["dtype"],
+                    name=col,
+                ),
+                SEM_VALOR[col],
+            )
+            for col, d in info["dimensoes"].items()
+        }
+        pares = pd.DataFrame(info["municipios"], columns=["SEQ_MUNICIPIO3", "NOM_MUNICIPIO"])
+        self.opcoes = opcoes_filtros(pares, self.dimensoes)
+        self.resultados = CacheResultados(limite_cache)
+
+    @classmethod
+    def conectar(cls, endereco: str) -> "ConjuntoRemoto":
+        return cls(TransporteSocket(endereco))
+
+    def pedir(self, operacao: str, tabela: pa.Table | None = None, **parametros) -> tuple[dict, pa.Table]:
+        if self.segredo:
+            parametros["segredo"] = self.segredo
+        if operacao != "info":
+            parametros["versao"] = self.versao
+        meta, resposta = decodificar(
+            self.transporte.pedir(codificar(dict(parametros, op=operacao), tabela))
+        )
+        if "versao" in meta and "erro" in meta:
+            raise VersaoDesatualizada(
+                f"Serviço de agregação: dados na versão {meta['versao']}, "
+                f"réplica na {self.versao}"
+            )
+        if "erro" in meta:
+            raise RuntimeError(f"Serviço de agregação: {meta['erro']}")
+        return meta, resposta
+
+    def linhas(self, posicoes: np.ndarray, colunas: list | None = None) -> pd.DataFrame:
+        posicoes = pa.table({"posicao": np.asarray(posicoes, dtype=np.int64)})
+        _, tabela = self.pedir("linhas", posicoes, colunas=colunas)
+        return para_df(tabela)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--dados", default=os.environ.get("BNMP_DADOS", "BNMP_MORADOR_RUA.CSV")
+    )
+    parser.add_argument(
+        "--endereco",
+        default=os.environ.get("BNMP_SERVICO", "bnmp-servico.sock"),
+        help='caminho do socket Unix ou "host:porta"',
+    )
+    parser.add_argument("--backend", default=BACKEND)
+    args = parser.parse_args()
+
+    conjunto = nucleo.carregar(args.dados, args.backend)
+    try:
+        servidor = servir(conjunto, args.endereco)
+    except ValueError as erro:
+        parser.error(str(erro))
+    print(f"{args.dados}: {conjunto.n_linhas} linhas, atendendo em {args.endereco}")
+    try:
+        servidor.serve_forever()
+    finally:
+        servidor.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Tabelas de domínio do BNMP usadas para rotular os códigos.
+
+Os rótulos entram nas colunas derivadas gravadas no cache colunar (ver
+dados.derivar); ao alterar estas tabelas, incremente dados.VERSAO_CACHE.
+"""
+
+# ==========================
+# Tabela de motivos do alvará (TABELA1)
+# ==========================
+MOTIVO_MAP = {
+    1: "Revogação de preventiva",
+    2: "Liberdade provisória com medidas cautelares",
+    3: "Liberdade provisória",
+    4: "Progressão de regime",
+    5: "Concessão de regime semiaberto harmonizado",
+    7: "Relaxamento de prisão",
+    8: "Revogação da prisão temporária",
+    9: "Extinção de punibilidade",
+    10: "Extinção da pena",
+    11: "Arquivamento do inquérito",
+    12: "Absolvição",
+    13: "Trancamento da ação penal",
+    14: "Quitação de débito alimentar",
+    15: "Revogação de deportação/extradição/expulsão",
+    16: "Livramento condicional",
+    17: "Arquivamento de ação penal",
+    18: "Outras medidas cautelares",
+    19: "Relaxamento de Prisão de Pessoa Presa em Lugar de Outra",
+    20: "Regime Aberto Monitoramento Eletrônico",
+    21: "Prisão domiciliar",
+    22: "Liberdade Provisória com fiança",
+    23: "Liberdade Provisória sem fiança",
+    24: "Habeas Corpus",
+    25: "Recolhimento da fiança arbitrada pela autoridade policial",
+    26: "Término da Prisão Temporária",
+    27: "Rejeição da denúncia ou queixa",
+    28: "Impronúncia",
+    29: "Condenação em regime aberto",
+    30: "Indulto humanitário",
+    31: "Regime Especial de semiliberdade aplicada à pessoa indígena",
+    99: "Revogação Decorrente de Erro Material no Mandado",
+}
+
+# ==========================
+# Tabela de status da pessoa
+# ==========================
+STATUS_MAP = {
+    2: "Procurado",
+    3: "Foragido",
+    4: "Morto",
+    5: "Em Liberdade",
+    7: "Preso Condenado em Execução Provisória",
+    8: "Preso Condenado em Execução Definitiva",
+    9: "Preso Provisório (inválido - não utilizar)",
+    10: "Internado Provisório",
+    11: "Internado em Execução Provisória",
+    12: "Internado em Execução Definitiva",
+    13: "Preso Civil",
+    14: "Em Monitoramento",
+    15: "Em Saída Temporária",
+    16: "Preso em Saída Temporária Autorizada para Estudo ou Trabalho",
+    17: "Evadido",
+    18: "Preso em Flagrante",
+    19: "Em Tratamento Ambulatorial",
+    20: "Em acompanhamento de medidas diversas da prisão",
+    21: "Em acompanhamento de medidas diversas da prisão em execução",
+    22: "Preso definitivo",
+    23: "Internado definitivo",
+    24: "Preso preventivo",
+    25: "Preso temporário",
+    26: "Aguardando soltura",
+    27: "Preso para deportação/extradição/expulsão",
+    28: "Deportado/extraditado/expulso",
+    29: "Procurado para condução coercitiva",
+}
+
+# Rótulo dos códigos ausentes das tabelas acima (ou nulos)
+NAO_INFORMADO = "Não informado / Outro"
+
+# Rótulo dos registros sem NOM_MUNICIPIO
+SEM_NOME_MUNICIPIO = "Sem município informado"
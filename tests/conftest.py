@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+COLUNAS = [
+    "SEQ_PECA", "SEQ_MUNICIPIO3", "NOM_MUNICIPIO", "SEQ_MOTIVO_EXPEDICAO_ALVARA",
+    "SEQ_STATUS", "SEQ_ALVARA_SOLTURA", "DSC_OBSERVACAO", "DAT_EXPEDICAO",
+]
+
+
+def extrato_df(n_linhas: int = 300, semente: int = 0) -> pd.DataFrame:
+    # Extrato pequeno no layout do BNMP, com códigos vazios nas três colunas
+    # filtráveis (opções SEM_*) e municípios sem nome
+    rng = np.random.default_rng(semente)
+    municipio = rng.integers(1, 12, n_linhas).astype(object)
+    municipio[rng.random(n_linhas) < 0.1] = None
+    nome = [f"MUNICIPIO {m}" if m is not None and m != 11 else None for m in municipio]
+    motivo = rng.choice([1, 2, 4, 7, 24, 55], n_linhas).astype(object)
+    motivo[rng.random(n_linhas) < 0.2] = None
+    status = rng.choice([2, 5, 24, 26], n_linhas).astype(object)
+    status[rng.random(n_linhas) < 0.1] = None
+    alvara = np.where(rng.random(n_linhas) < 0.5, np.arange(100000, 100000 + n_linhas), None)
+    return pd.DataFrame(
+        {
+            "SEQ_PECA": np.arange(1, n_linhas + 1),
+            "SEQ_MUNICIPIO3": municipio,
+            "NOM_MUNICIPIO": nome,
+            "SEQ_MOTIVO_EXPEDICAO_ALVARA": motivo,
+            "SEQ_STATUS": status,
+            "SEQ_ALVARA_SOLTURA": alvara,
+            "DSC_OBSERVACAO": "obs",
+            "DAT_EXPEDICAO": "2024-01-01",
+        },
+        columns=COLUNAS,
+    )
+
+
+def gravar_extrato(df: pd.DataFrame, path) -> str:
+    df.to_csv(path, sep=";", index=False)
+    return str(path)
+
+
+@pytest.fixture
+def extrato(tmp_path) -> str:
+    # Caminho de um CSV de extrato; o cache colunar fica ao lado, em tmp_path
+    return gravar_extrato(extrato_df(), tmp_path / "BNMP_MORADOR_RUA.CSV")
@@ -0,0 +1,46 @@
+from cache_resultados import CacheResultados
+
+
+class Item:
+    def __init__(self, tamanho: int):
+        self.tamanho = tamanho
+
+    def nbytes(self) -> int:
+        return self.tamanho
+
+
+def test_descarta_o_menos_usado_ao_passar_do_limite():
+    cache = CacheResultados(limite_bytes=100)
+    a = cache.obter("a", lambda: Item(40))
+    cache.obter("b", lambda: Item(40))
+    assert cache.obter("a", lambda: Item(40)) is a  # "a" passa a ser o mais recente
+    cache.obter("c", lambda: Item(40))
+
+    estatisticas = cache.estatisticas()
+    assert (estatisticas["acertos"], estatisticas["falhas"]) == (1, 3)
+    assert (estatisticas["itens"], estatisticas["bytes"]) == (2, 80)
+    assert cache.obter("a", lambda: Item(40)) is a
+    assert cache.obter("b", lambda: Item(40)) is not None
+    assert cache.estatisticas()["falhas"] == 4  # "b" foi descartado
+
+
+def test_remedir_considera_o_crescimento_da_entrada():
+    cache = CacheResultados(limite_bytes=100)
+    a = cache.obter("a", lambda: Item(30))
+    b = cache.obter("b", lambda: Item(30))
+    b.tamanho = 90
+    cache.remedir("b")
+    assert cache.estatisticas()["itens"] == 1
+    assert cache.obter("b", lambda: Item(0)) is b
+    assert cache.obter("a", lambda: Item(0)) is not a
+
+
+def test_entrada_maior_que_o_limite_fica_sozinha():
+    cache = CacheResultados(limite_bytes=10)
+    cache.obter("a", lambda: Item(5))
+    grande = cache.obter("b", lambda: Item(50))
+    assert cache.estatisticas()["itens"] == 1
+    assert cache.obter("b", lambda: Item(0)) is grande
+
+    cache.limpar()
+    assert cache.estatisticas()["bytes"] == 0
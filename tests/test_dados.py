@@ -0,0 +1,72 @@
+import pandas as pd
+import pytest
+
+import dados
+from conftest import extrato_df, gravar_extrato
+
+
+def _normalizar(agregados: pd.DataFrame) -> pd.DataFrame:
+    chaves = [c for c in agregados.columns if c not in ("linhas", "pecas")]
+    return (
+        agregados.astype({c: object for c in chaves})
+        .sort_values(chaves)
+        .reset_index(drop=True)
+    )
+
+
+def _recusar(nome):
+    def recusar(*args, **kwargs):
+        raise AssertionError(f"{nome} não deveria ser chamado")
+    return recusar
+
+
+def test_linhas_acrescentadas_reaproveitam_o_cache(tmp_path, monkeypatch):
+    df = extrato_df(600)
+    path = gravar_extrato(df.iloc[:400], tmp_path / "BNMP_MORADOR_RUA.CSV")
+    dados.carregar_extrato(path)
+    anterior = dados.ler_manifesto(dados.diretorio_cache(path))
+
+    gravar_extrato(df, path)
+    with monkeypatch.context() as m:
+        m.setattr(dados, "ingerir_em_blocos", _recusar("ingerir_em_blocos"))
+        tabela, versao, agregados = dados.carregar_extrato(path)
+    manifesto = dados.ler_manifesto(dados.diretorio_cache(path))
+    assert manifesto["partes"][: len(anterior["partes"])] == anterior["partes"]
+    assert len(manifesto["partes"]) > len(anterior["partes"])
+    assert manifesto["linhas"] == tabela.num_rows == len(df)
+
+    # Igual a ingerir o extrato inteiro do zero
+    completo = gravar_extrato(df, tmp_path / "completo.csv")
+    tabela_ref, versao_ref, agregados_ref = dados.carregar_extrato(completo)
+    assert versao == versao_ref
+    pd.testing.assert_frame_equal(
+        dados.para_pandas(tabela), dados.para_pandas(tabela_ref), check_categorical=False
+    )
+    pd.testing.assert_frame_equal(_normalizar(agregados), _normalizar(agregados_ref))
+
+
+def test_extrato_alterado_e_reingerido(tmp_path, monkeypatch):
+    df = extrato_df(200)
+    path = gravar_extrato(df, tmp_path / "BNMP_MORADOR_RUA.CSV")
+    dados.carregar_extrato(path)
+
+    df.loc[0, "SEQ_STATUS"] = 26 if df.loc[0, "SEQ_STATUS"] != 26 else 2
+    gravar_extrato(pd.concat([df, extrato_df(10, semente=1)]), path)
+    with monkeypatch.context() as m:
+        m.setattr(dados, "anexar_cauda", _recusar("anexar_cauda"))
+        tabela, _, _ = dados.carregar_extrato(path)
+    assert tabela.num_rows == 210
+    assert tabela.column("SEQ_STATUS")[0].as_py() == df.loc[0, "SEQ_STATUS"]
+
+
+@pytest.mark.parametrize(
+    "valores, esperado",
+    [
+        (["1", "2", None], [1, 2, None]),
+        (["1.0", "1.5", "x", "1e30"], [1, None, None, None]),
+        (["40000"], [40000]),  # não cabe em Int16: cai para Int64
+    ],
+)
+def test_converter_codigo_anula_valores_sem_conversao_exata(valores, esperado):
+    convertido = dados.converter_codigo(pd.Series(valores, dtype=object), "Int16")
+    assert convertido.astype(object).where(convertido.notna(), None).tolist() == esperado
@@ -0,0 +1,32 @@
+import io
+import os
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+from streamlit.runtime.download_data_util import convert_data_to_bytes_and_infer_mime
+
+import exportar
+
+
+def _lotes():
+    yield pd.DataFrame({"SEQ_PECA": [1, 2], "NOM_MUNICIPIO": pd.Categorical(["A", "B"])})
+    yield pd.DataFrame({"SEQ_PECA": [3], "NOM_MUNICIPIO": pd.Categorical(["C"])})
+
+
+@pytest.mark.parametrize("formato", list(exportar.FORMATOS))
+def test_arquivo_aceito_pelo_download_button(formato):
+    arquivo = exportar.arquivo_temporario(_lotes(), formato)
+    caminho = arquivo.name
+    conteudo, _ = convert_data_to_bytes_and_infer_mime(arquivo, ValueError("tipo não suportado"))
+
+    if formato == "csv":
+        assert conteudo.decode("utf-8").splitlines() == [
+            "SEQ_PECA;NOM_MUNICIPIO", "1;A", "2;B", "3;C"
+        ]
+    else:
+        tabela = pq.read_table(io.BytesIO(conteudo))
+        assert tabela.column("SEQ_PECA").to_pylist() == [1, 2, 3]
+        assert tabela.column("NOM_MUNICIPIO").to_pylist() == ["A", "B", "C"]
+    # O temporário é apagado depois de lido
+    assert arquivo.closed and not os.path.exists(caminho)
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+import dados
+from app_principal import filtrarMotivo, filtrarMunicipio, filtrarStatus
+from indice import IndiceFiltros
+
+FILTROS = {
+    "SEQ_MUNICIPIO3": filtrarMunicipio,
+    "SEQ_MOTIVO_EXPEDICAO_ALVARA": filtrarMotivo,
+    "SEQ_STATUS": filtrarStatus,
+}
+
+SELECOES = [
+    {},
+    {"SEQ_MUNICIPIO3": ["SEM_MUNICIPIO"]},
+    {"SEQ_MOTIVO_EXPEDICAO_ALVARA": ["SEM_MOTIVO"]},
+    {"SEQ_STATUS": ["SEM_STATUS", 5]},
+    {"SEQ_MUNICIPIO3": [3, 1, 3, "SEM_MUNICIPIO"], "SEQ_MOTIVO_EXPEDICAO_ALVARA": [24]},
+    {"SEQ_MUNICIPIO3": [999], "SEQ_STATUS": [2]},
+    {"SEQ_MUNICIPIO3": [], "SEQ_MOTIVO_EXPEDICAO_ALVARA": [1, 2, 4, 7, 24, 55, "SEM_MOTIVO"]},
+]
+
+
+def _aleatorias(df, n: int, semente: int = 1) -> list:
+    rng = np.random.default_rng(semente)
+    opcoes = {
+        col: [int(v) for v in df[col].dropna().unique()] + [f"SEM_{nome}"]
+        for col, nome in (
+            ("SEQ_MUNICIPIO3", "MUNICIPIO"),
+            ("SEQ_MOTIVO_EXPEDICAO_ALVARA", "MOTIVO"),
+            ("SEQ_STATUS", "STATUS"),
+        )
+    }
+    selecoes = []
+    for _ in range(n):
+        selecoes.append({
+            col: list(rng.choice(np.array(valores, dtype=object), rng.integers(0, 5)))
+            for col, valores in opcoes.items()
+            if rng.random() < 0.7
+        })
+    return selecoes
+
+
+@pytest.fixture
+def df(extrato):
+    return dados.ler_csv(extrato)
+
+
+def test_selecionar_igual_aos_filtros_linha_a_linha(df):
+    indice = IndiceFiltros(df)
+    for selecoes in SELECOES + _aleatorias(df, 50):
+        esperado = df
+        for col, selecionados in selecoes.items():
+            if selecionados:  # lista vazia = sem filtro
+                esperado = FILTROS[col](selecionados, esperado)
+        np.testing.assert_array_equal(
+            indice.selecionar(selecoes), df.index.get_indexer(esperado.index), err_msg=str(selecoes)
+        )
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import nucleo
+from conftest import extrato_df, gravar_extrato
+from particoes import ConjuntoParticionado
+
+
+@pytest.fixture
+def conjuntos(tmp_path):
+    # Duas partições por faixa de município (1-5 e o resto, com os nulos) e
+    # o mesmo extrato num arquivo só, como referência
+    df = extrato_df()
+    baixa = df["SEQ_MUNICIPIO3"].map(lambda m: m is not None and m <= 5)
+    paths = []
+    for nome, parte in (("baixa", df[baixa]), ("alta", df[~baixa])):
+        (tmp_path / nome).mkdir()
+        paths.append(gravar_extrato(parte, tmp_path / nome / "extrato.csv"))
+    referencia = gravar_extrato(
+        pd.concat([df[baixa], df[~baixa]]), tmp_path / "BNMP_MORADOR_RUA.CSV"
+    )
+    return nucleo.carregar(referencia, "memoria"), ConjuntoParticionado(paths)
+
+
+def test_abre_sem_montar_as_particoes(conjuntos):
+    _, particionado = conjuntos
+    assert all(p._conjunto is None for p in particionado.particoes)
+
+
+@pytest.mark.parametrize(
+    "selecoes, lidas",
+    [
+        ({"SEQ_MUNICIPIO3": [2, 4]}, ["baixa"]),
+        ({"SEQ_MUNICIPIO3": ["SEM_MUNICIPIO"]}, ["alta"]),
+        ({"SEQ_MUNICIPIO3": [1, 9], "SEQ_STATUS": [5]}, ["baixa", "alta"]),
+        ({"SEQ_MUNICIPIO3": [999]}, []),
+    ],
+)
+def test_poda_e_mesmo_resultado(conjuntos, selecoes, lidas):
+    local, particionado = conjuntos
+    esperado, obtido = local.consultar(selecoes), particionado.consultar(selecoes)
+
+    np.testing.assert_array_equal(obtido.posicoes, esperado.posicoes)
+    np.testing.assert_array_equal(
+        obtido.ordenadas("SEQ_PECA", True), esperado.ordenadas("SEQ_PECA", True)
+    )
+    assert obtido.resumo == esperado.resumo
+    assert obtido.resumo_primeiros(7) == esperado.resumo_primeiros(7)
+    assert [
+        p.path.split("/")[-2] for p in particionado.particoes if p._conjunto is not None
+    ] == lidas
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import nucleo
+import servico
+
+SELECOES = [
+    {},
+    {"SEQ_MUNICIPIO3": [1, 2, 11]},
+    {"SEQ_MUNICIPIO3": ["SEM_MUNICIPIO"], "SEQ_STATUS": [5]},
+    {"SEQ_MOTIVO_EXPEDICAO_ALVARA": [24, "SEM_MOTIVO"], "SEQ_STATUS": [2, "SEM_STATUS"]},
+    {"SEQ_MUNICIPIO3": [3], "SEQ_MOTIVO_EXPEDICAO_ALVARA": [55], "SEQ_STATUS": [26]},
+    {"SEQ_MUNICIPIO3": [999]},
+]
+
+
+@pytest.fixture
+def conjuntos(extrato):
+    local = nucleo.carregar(extrato, "memoria")
+    return local, servico.ConjuntoRemoto(servico.TransporteLocal(local))
+
+
+def test_info_reproduz_opcoes_do_servidor(conjuntos):
+    local, remoto = conjuntos
+    assert (remoto.versao, remoto.colunas, remoto.n_linhas) == (
+        local.versao, local.colunas, local.n_linhas
+    )
+    for col, opcoes in local.opcoes.items():
+        assert remoto.opcoes[col].opcoes == opcoes.opcoes
+        assert remoto.opcoes[col].rotulos == opcoes.rotulos
+
+
+@pytest.mark.parametrize("selecoes", SELECOES)
+def test_remoto_igual_ao_local(conjuntos, selecoes):
+    local, remoto = conjuntos
+    assert remoto.chave(selecoes) == local.chave(selecoes)
+    esperado, obtido = local.consultar(selecoes), remoto.consultar(selecoes)
+
+    assert obtido.n_linhas == esperado.n_linhas
+    np.testing.assert_array_equal(obtido.posicoes, esperado.posicoes)
+    assert obtido.resumo == esperado.resumo
+    assert obtido.resumo_primeiros(10) == esperado.resumo_primeiros(10)
+    pd.testing.assert_frame_equal(obtido.motivo_counts, esperado.motivo_counts)
+    pd.testing.assert_frame_equal(obtido.muni_counts, esperado.muni_counts)
+    for coluna, decrescente in (("SEQ_PECA", True), ("DSC_MUNICIPIO", False)):
+        np.testing.assert_array_equal(
+            obtido.ordenadas(coluna, decrescente), esperado.ordenadas(coluna, decrescente)
+        )
+    posicoes = esperado.posicoes[:50]
+    pd.testing.assert_frame_equal(remoto.linhas(posicoes), local.linhas(posicoes))
+    pd.testing.assert_frame_equal(
+        remoto.linhas(posicoes, ["SEQ_PECA"]), local.linhas(posicoes, ["SEQ_PECA"])
+    )
+
+
+def test_coluna_desconhecida_e_recusada(conjuntos):
+    _, remoto = conjuntos
+    with pytest.raises(RuntimeError, match="Coluna desconhecida"):
+        remoto.consultar({}).ordenadas("SEQ_PECA; DROP TABLE bnmp")
+
+
+def test_versao_desatualizada(conjuntos):
+    _, remoto = conjuntos
+    remoto.versao = "outra"
+    with pytest.raises(servico.VersaoDesatualizada):
+        _ = remoto.consultar({}).posicoes